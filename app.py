@@ -1,6 +1,9 @@
 import streamlit as st
 
 from utils.filters import init_sidebar_filters
+from utils.metrics import end_trace, show_debug_panel, start_trace, write_metrics_file
+from utils.server import start_server
+from utils.warmup import start_warmup
 
 
 def init_config() -> None:
@@ -64,7 +67,13 @@ def init_config() -> None:
 
 
 def app() -> None:
+    start_trace()
     init_config()
+
+    # No-ops when already started by serve.py or a previous run
+    start_warmup()
+    start_server()
+
     init_sidebar_filters()
 
     # Sidebar link
@@ -85,6 +94,9 @@ def app() -> None:
         use_container_width=True
     )
 
+    show_debug_panel(end_trace())
+    write_metrics_file()
+
     # st.session_state # uncomment for debugging
 
 
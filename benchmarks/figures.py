@@ -0,0 +1,62 @@
+"""Figures built as the Metric, Map and Time views build them.
+
+The views are Streamlit scripts, so their plotting code is mirrored here
+with the default controls to time figure construction and serialization.
+"""
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from utils.distypes import TYPE_COLORS, TYPE_ORDER
+
+
+def metric_figure(metrics: dict) -> go.Figure:
+    """Disaster type distribution of the Metric view."""
+    df = metrics['distribution']
+    order = [i for i in TYPE_ORDER if i in df['disaster_type'].unique()][::-1]
+    colors = [c for k, c in TYPE_COLORS.items() if k in df['disaster_type'].unique()][::-1]
+    df = df.set_index('disaster_type').loc[order].reset_index()
+
+    fig = make_subplots(
+        rows=1, cols=4, shared_yaxes=True,
+        subplot_titles=("N° Count", "Total Deaths", "Total Affected", "Total Damage")
+    )
+    for i, name in enumerate(['count', 'death', 'affected', 'damage'], start=1):
+        fig.add_trace(go.Bar(y=df['disaster_type'], x=df[name], orientation='h', marker_color=colors), 1, i)
+        fig.update_xaxes(title_text='Percent %', row=1, col=i)
+    fig.update_layout(height=500 + 10 * len(df) ** 0.75, showlegend=False)
+    return fig
+
+
+def map_figure(maps: dict, aggregator: str = 'Total', variable: str = 'count') -> go.Figure:
+    """Country choropleth of the Map view."""
+    data_map = maps[aggregator]
+    data_map = data_map[data_map['mappable']]
+    fig = go.Figure(
+        data=go.Choropleth(
+            locations=data_map['iso'],
+            z=data_map[variable],
+            text=data_map['country'],
+            colorscale='amp_r',
+            marker_line_color='darkgray',
+            marker_line_width=.5
+        )
+    )
+    fig.update_geos(resolution=50, showland=True, landcolor='#dddddd')
+    fig.update_layout(height=600, geo=dict(showframe=False, projection_type='equirectangular'))
+    return fig
+
+
+def time_figure(series: dict, stacker: str = 'Types', variable: str = 'count') -> go.Figure:
+    """Yearly bars of the Time view, stacked by disaster type."""
+    data_time = series[stacker]
+    order = [i for i in TYPE_ORDER if i in data_time['disaster_type'].unique()]
+    fig = px.bar(
+        data_time,
+        x='start_year',
+        y=variable,
+        color='disaster_type',
+        category_orders={'disaster_type': order}
+    )
+    fig.for_each_trace(lambda t: t.update(marker_color=TYPE_COLORS.get(t.name, '#214B8C')))
+    return fig
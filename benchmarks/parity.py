@@ -0,0 +1,130 @@
+"""Check that every query engine returns the same results as plain pandas.
+
+Usage::
+
+    python -m benchmarks.parity                  # all engines
+    python -m benchmarks.parity --rows 1000000 --engines duckdb
+
+Runs the benchmark filter cases on synthetic EM-DAT data with each engine
+of ``utils.engine`` and compares the filtered rows, the filtered cube and
+the Metric, Map and Time stages built on it with those of the reference:
+``utils.filters.filter_data`` masks over the whole frame, and a cube built
+from its rows. Exits with status 1 on any difference.
+"""
+import argparse
+import sys
+import tempfile
+
+import pandas as pd
+
+from benchmarks.run import FILTER_CASES
+from benchmarks.synthetic import make_emdata
+
+# More cases than the benchmark's, for the SQL translation of each filter
+PARITY_CASES = {
+    **FILTER_CASES,
+    'wildcard': {'classification_key': 'nat-*-flo'},
+    'key_anywhere': {'classification_key': 'sto-'},
+    'no_match': {'classification_key': 'zzz'},
+    'subregion': {'region': 'Africa', 'subregion': 'Sub-Saharan Africa'},
+    'one_year': {'start': 2005, 'end': 2005},
+    'active_decade': {'period': ('1980-01-01', '1989-12-31'), 'classification_key': 'nat-cli'},
+    'active_day': {'period': ('2011-03-11', '2011-03-11'), 'region': 'Asia'}
+}
+
+
+def sorted_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """Return ``data`` in a canonical row order, for order-free comparisons."""
+    return data.sort_values(list(data.columns)).reset_index(drop=True)
+
+
+def compare(name: str, expected, actual, ordered: bool = True) -> list:
+    """Return the differences between two results, as messages."""
+    if isinstance(expected, dict):
+        errors = []
+        for key in expected:
+            errors += compare(f'{name}[{key!r}]', expected[key], actual.get(key), ordered)
+        return errors
+    if not ordered:
+        expected, actual = sorted_frame(expected), sorted_frame(actual)
+    try:
+        pd.testing.assert_frame_equal(expected, actual, check_exact=False)
+    except AssertionError as e:
+        return [f'{name}: {e}']
+    return []
+
+
+class ReferenceEngine:
+    """Filter the dataset with boolean masks, without its index or cube."""
+
+    name = 'reference'
+
+    def filtered_data(self, dataset, filters: dict) -> pd.DataFrame:
+        from utils.filters import filter_data
+        return filter_data(dataset.data, filters)
+
+    def filtered_cube(self, dataset, filters: dict) -> pd.DataFrame:
+        from utils.cube import build_cube
+        return build_cube(self.filtered_data(dataset, filters))
+
+
+def check_engine(engine, reference, dataset, cases: dict) -> list:
+    from utils.aggregates import map_aggregates, metric_table, time_series
+
+    errors = []
+    for case, filters in cases.items():
+        errors += compare(
+            f'{case} data',
+            reference.filtered_data(dataset, filters),
+            engine.filtered_data(dataset, filters)
+        )
+        expected = reference.filtered_cube(dataset, filters)
+        actual = engine.filtered_cube(dataset, filters)
+        # Cells come in the order each engine groups them
+        errors += compare(f'{case} cube', expected, actual, ordered=False)
+        for stage, build in (
+                ('metric', metric_table),
+                ('map', lambda cube: map_aggregates(cube, dataset.geo)),
+                ('time', time_series)):
+            errors += compare(f'{case} {stage}', build(expected), build(actual))
+    return errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000,
+                        help='number of synthetic rows')
+    parser.add_argument('--engines', nargs='+',
+                        help='engines to check, every available one by default')
+    args = parser.parse_args()
+
+    from utils.database import get_core_columns
+    from utils.dataset import make_dataset
+    from utils.engine import ENGINES, PandasEngine
+    from utils.filters import default_filters
+    from utils.schema import apply_schema
+
+    raw = make_emdata(args.rows)
+    columns = list(raw.columns)
+    dataset = make_dataset(apply_schema(raw[get_core_columns(columns)]), columns)
+    defaults = default_filters(dataset)
+    cases = {name: {**defaults, **case} for name, case in PARITY_CASES.items()}
+
+    failed = False
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.engines or list(ENGINES):
+            try:
+                engine = ENGINES[name](workdir) if name != 'pandas' else PandasEngine()
+            except ImportError as e:
+                print(f"{name}: skipped ({e})", file=sys.stderr)
+                continue
+            errors = check_engine(engine, ReferenceEngine(), dataset, cases)
+            print(f"{name}: {len(cases)} cases, {len(errors)} differences", file=sys.stderr)
+            for error in errors:
+                print(f"  {error}", file=sys.stderr)
+            failed |= bool(errors)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
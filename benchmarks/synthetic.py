@@ -0,0 +1,236 @@
+"""Synthetic EM-DAT data shaped like ``public.emdata_hist``.
+
+Frames are returned as the database loader reads them (object strings,
+float64 figures), so that the schema and every later stage are exercised
+as in production. Distributions are skewed the way the real table is: a
+few countries and disaster types hold most events, events get more
+frequent over time, and impact figures are heavy-tailed and often missing.
+"""
+import numpy as np
+import pandas as pd
+
+# (country, iso, region, subregion, relative frequency)
+COUNTRIES = [
+    ('United States of America', 'USA', 'Americas', 'Northern America', 100),
+    ('China', 'CHN', 'Asia', 'Eastern Asia', 95),
+    ('India', 'IND', 'Asia', 'Southern Asia', 80),
+    ('Philippines', 'PHL', 'Asia', 'South-eastern Asia', 70),
+    ('Indonesia', 'IDN', 'Asia', 'South-eastern Asia', 60),
+    ('Bangladesh', 'BGD', 'Asia', 'Southern Asia', 40),
+    ('Japan', 'JPN', 'Asia', 'Eastern Asia', 40),
+    ('Brazil', 'BRA', 'Americas', 'Latin America and the Caribbean', 38),
+    ('Mexico', 'MEX', 'Americas', 'Latin America and the Caribbean', 36),
+    ('Nigeria', 'NGA', 'Africa', 'Sub-Saharan Africa', 35),
+    ('Pakistan', 'PAK', 'Asia', 'Southern Asia', 33),
+    ('Iran (Islamic Republic of)', 'IRN', 'Asia', 'Southern Asia', 30),
+    ('Viet Nam', 'VNM', 'Asia', 'South-eastern Asia', 28),
+    ('Russian Federation', 'RUS', 'Europe', 'Eastern Europe', 27),
+    ('Democratic Republic of the Congo', 'COD', 'Africa', 'Sub-Saharan Africa', 26),
+    ('Türkiye', 'TUR', 'Asia', 'Western Asia', 24),
+    ('Colombia', 'COL', 'Americas', 'Latin America and the Caribbean', 22),
+    ('Peru', 'PER', 'Americas', 'Latin America and the Caribbean', 21),
+    ('Kenya', 'KEN', 'Africa', 'Sub-Saharan Africa', 20),
+    ('France', 'FRA', 'Europe', 'Western Europe', 20),
+    ('Italy', 'ITA', 'Europe', 'Southern Europe', 19),
+    ('Australia', 'AUS', 'Oceania', 'Australia and New Zealand', 18),
+    ('South Africa', 'ZAF', 'Africa', 'Sub-Saharan Africa', 17),
+    ('Egypt', 'EGY', 'Africa', 'Northern Africa', 15),
+    ('Haiti', 'HTI', 'Americas', 'Latin America and the Caribbean', 14),
+    ('Germany', 'DEU', 'Europe', 'Western Europe', 14),
+    ('United Kingdom of Great Britain and Northern Ireland', 'GBR', 'Europe', 'Northern Europe', 13),
+    ('Spain', 'ESP', 'Europe', 'Southern Europe', 12),
+    ('Canada', 'CAN', 'Americas', 'Northern America', 12),
+    ('Ethiopia', 'ETH', 'Africa', 'Sub-Saharan Africa', 12),
+    ('Mozambique', 'MOZ', 'Africa', 'Sub-Saharan Africa', 11),
+    ('Guatemala', 'GTM', 'Americas', 'Latin America and the Caribbean', 10),
+    ('Nepal', 'NPL', 'Asia', 'Southern Asia', 10),
+    ('Afghanistan', 'AFG', 'Asia', 'Southern Asia', 10),
+    ('Greece', 'GRC', 'Europe', 'Southern Europe', 8),
+    ('Morocco', 'MAR', 'Africa', 'Northern Africa', 7),
+    ('Chile', 'CHL', 'Americas', 'Latin America and the Caribbean', 7),
+    ('Saudi Arabia', 'SAU', 'Asia', 'Western Asia', 5),
+    ('Poland', 'POL', 'Europe', 'Eastern Europe', 5),
+    ('Papua New Guinea', 'PNG', 'Oceania', 'Melanesia', 5),
+    ('Fiji', 'FJI', 'Oceania', 'Melanesia', 4),
+    ('New Zealand', 'NZL', 'Oceania', 'Australia and New Zealand', 4),
+    ('Kazakhstan', 'KAZ', 'Asia', 'Central Asia', 3),
+    ('Sweden', 'SWE', 'Europe', 'Northern Europe', 2),
+    ('Samoa', 'WSM', 'Oceania', 'Polynesia', 1),
+    ('Soviet Union', 'SUN', 'Europe', 'Eastern Europe', 3),
+    ('Yugoslavia', 'YUG', 'Europe', 'Southern Europe', 2),
+    ('Czechoslovakia', 'CSK', 'Europe', 'Eastern Europe', 1),
+    ('German Democratic Republic', 'DDR', 'Europe', 'Western Europe', 1)
+]
+
+# Former countries only have events before they ceased to exist
+HISTORIC_UNTIL = {'SUN': 1991, 'YUG': 2002, 'CSK': 1992, 'DDR': 1990}
+
+# (disaster type, classification keys, relative frequency, impact scale)
+DISASTER_TYPES = [
+    ('Flood', ['nat-hyd-flo-riv', 'nat-hyd-flo-fla', 'nat-hyd-flo-coa', 'nat-hyd-flo-flo'], 200, 1.0),
+    ('Storm', ['nat-met-sto-tro', 'nat-met-sto-ext', 'nat-met-sto-con'], 150, 1.5),
+    ('Road', ['tec-tra-roa-roa'], 120, 0.1),
+    ('Epidemic', ['nat-bio-epi-vir', 'nat-bio-epi-bac', 'nat-bio-epi-par'], 70, 2.0),
+    ('Earthquake', ['nat-geo-ear-gro', 'nat-geo-ear-tsu'], 60, 5.0),
+    ('Water', ['tec-tra-wat-wat'], 60, 0.2),
+    ('Drought', ['nat-cli-dro-dro'], 40, 20.0),
+    ('Mass movement (wet)', ['nat-hyd-mmw-lan', 'nat-hyd-mmw-mud'], 40, 0.3),
+    ('Extreme temperature', ['nat-met-ext-hea', 'nat-met-ext-col'], 40, 1.0),
+    ('Air', ['tec-tra-air-air'], 30, 0.1),
+    ('Fire (Miscellaneous)', ['tec-mis-fir-fir'], 30, 0.1),
+    ('Wildfire', ['nat-cli-wil-for', 'nat-cli-wil-lan'], 30, 0.5),
+    ('Explosion (Industrial)', ['tec-ind-exp-exp'], 30, 0.1),
+    ('Rail', ['tec-tra-rai-rai'], 20, 0.1),
+    ('Collapse (Miscellaneous)', ['tec-mis-col-col'], 20, 0.1),
+    ('Volcanic activity', ['nat-geo-vol-ash', 'nat-geo-vol-lah'], 10, 1.0),
+    ('Infestation', ['nat-bio-inf-inf'], 5, 3.0)
+]
+
+GROUPS = {'nat': 'Natural', 'tec': 'Technological'}
+SUBGROUPS = {
+    'hyd': 'Hydrological',
+    'met': 'Meteorological',
+    'geo': 'Geophysical',
+    'cli': 'Climatological',
+    'bio': 'Biological',
+    'tra': 'Transport',
+    'ind': 'Industrial accident',
+    'mis': 'Miscellaneous accident'
+}
+
+# Share of events reporting each figure, and the typical size of a report
+IMPACTS = {
+    'total_deaths': (0.7, 10),
+    'no_injured': (0.3, 20),
+    'no_affected': (0.5, 2_000),
+    'no_homeless': (0.1, 500),
+    'total_affected': (0.6, 2_000),
+    'reconstruction_costs_usd_thousands': (0.02, 10_000),
+    'insured_damage_usd_thousands': (0.05, 20_000),
+    'total_damage_usd_thousands': (0.3, 10_000)
+}
+
+FIRST_YEAR = 1900
+LAST_YEAR = 2024
+
+
+def pick(rng: np.random.Generator, weights, n: int) -> np.ndarray:
+    """Draw ``n`` indices with probabilities proportional to ``weights``."""
+    weights = np.asarray(weights, dtype=float)
+    return rng.choice(len(weights), size=n, p=weights / weights.sum())
+
+
+def heavy_tailed(
+        rng: np.random.Generator,
+        scale: np.ndarray,
+        share: float) -> np.ndarray:
+    """Pareto-distributed figures, missing for ``1 - share`` of the rows."""
+    values = np.floor(scale * (rng.pareto(1.1, len(scale)) + 1))
+    # Stay within the Int32 range the schema uses for people counts
+    values = np.minimum(values, 2 ** 31 - 1)
+    values[rng.random(len(scale)) >= share] = np.nan
+    return values
+
+
+def make_emdata(n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Parameters
+    ----------
+    n : int
+        Number of rows, one per disaster and country as in EM-DAT.
+    seed : int, optional
+        Seed of the random generator: equal seeds give equal frames.
+
+    Returns
+    -------
+    pd.DataFrame
+        A frame with the columns of ``public.emdata_hist`` used by the app,
+        typed as read from Postgres.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Exponentially more events in recent years, as reporting improved
+    years = np.arange(FIRST_YEAR, LAST_YEAR + 1)
+    start_year = years[pick(rng, np.exp((years - LAST_YEAR) / 25), n)]
+
+    country = pick(rng, [c[4] for c in COUNTRIES], n)
+    iso = np.array([c[1] for c in COUNTRIES])[country]
+    # Events of former countries are moved before their dissolution
+    for code, until in HISTORIC_UNTIL.items():
+        rows = iso == code
+        start_year[rows] = np.minimum(start_year[rows], until)
+
+    kind = pick(rng, [t[2] for t in DISASTER_TYPES], n)
+    key_choice = rng.integers(0, 4, n)
+    keys = np.array([
+        t[1][k % len(t[1])] for t in DISASTER_TYPES for k in range(4)
+    ])[kind * 4 + key_choice]
+    parts = pd.Series(keys).str.split('-', expand=True)
+
+    # Most events start and end the same year
+    duration = np.where(rng.random(n) < 0.9, 0, rng.integers(1, 4, n))
+    end_year = np.minimum(start_year + duration, LAST_YEAR)
+    start_month = rng.integers(1, 13, n)
+    end_month = np.where(duration == 0, np.maximum(start_month, rng.integers(1, 13, n)), rng.integers(1, 13, n))
+    start_day = rng.integers(1, 29, n)
+    end_day = rng.integers(1, 29, n)
+    end_day = np.where((duration == 0) & (end_month == start_month), np.maximum(start_day, end_day), end_day)
+
+    scale = np.array([t[3] for t in DISASTER_TYPES])[kind]
+
+    def column(values, names):
+        return np.array(names, dtype=object)[values]
+
+    def dates(year, month, day):
+        return pd.to_datetime(
+            pd.DataFrame({'year': year, 'month': month, 'day': day})
+        ).dt.date
+
+    # DisNo. are numbered within each year
+    sequence = pd.Series(start_year).groupby(start_year).cumcount().astype(str).str.zfill(4)
+    data = pd.DataFrame({
+        'disno': pd.Series(start_year).astype(str) + '-' + sequence + '-' + iso,
+        'historic': np.where(np.isin(iso, list(HISTORIC_UNTIL)), 'Yes', 'No').astype(object),
+        'classification_key': keys.astype(object),
+        'disaster_group': parts[0].map(GROUPS),
+        'disaster_subgroup': parts[1].map(SUBGROUPS),
+        'disaster_type': column(kind, [t[0] for t in DISASTER_TYPES]),
+        'disaster_subtype': parts[3].str.capitalize(),
+        'iso': iso.astype(object),
+        'country': column(country, [c[0] for c in COUNTRIES]),
+        'subregion': column(country, [c[3] for c in COUNTRIES]),
+        'region': column(country, [c[2] for c in COUNTRIES]),
+        'origin': None,
+        'associated_types': None,
+        'ofda_bha_response': np.where(rng.random(n) < 0.1, 'Yes', 'No').astype(object),
+        'appeal': np.where(rng.random(n) < 0.1, 'Yes', 'No').astype(object),
+        'declaration': np.where(rng.random(n) < 0.2, 'Yes', 'No').astype(object),
+        'magnitude': np.where(rng.random(n) < 0.3, rng.gamma(2.0, 50.0, n), np.nan),
+        'magnitude_scale': column(rng.integers(0, 3, n), ['Km2', 'Richter', 'Kph']),
+        'latitude': np.where(rng.random(n) < 0.2, rng.uniform(-60, 70, n), np.nan),
+        'longitude': np.where(rng.random(n) < 0.2, rng.uniform(-180, 180, n), np.nan),
+        'start_year': start_year.astype(float),
+        'start_month': start_month.astype(float),
+        'start_day': start_day.astype(float),
+        'end_year': end_year.astype(float),
+        'end_month': end_month.astype(float),
+        'end_day': end_day.astype(float),
+        'start_date': dates(start_year, start_month, start_day),
+        'end_date': dates(end_year, end_month, end_day),
+        'event_name': None
+    })
+
+    for name, (share, typical) in IMPACTS.items():
+        data[name] = heavy_tailed(rng, scale * typical, share)
+    data['total_damage_adjusted_usd_thousands'] = np.floor(
+        data['total_damage_usd_thousands'] * (1 + (LAST_YEAR - start_year) / 30)
+    )
+    data['reconstruction_costs_adjusted_usd_thousands'] = data['reconstruction_costs_usd_thousands']
+    data['insured_damage_adjusted_usd_thousands'] = data['insured_damage_usd_thousands']
+
+    entry = pd.Timestamp(f'{LAST_YEAR}-12-31') - pd.to_timedelta(
+        rng.integers(0, 3650, n), unit='D'
+    )
+    data['entry_date'] = entry.date
+    data['last_update'] = entry
+    return data
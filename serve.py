@@ -0,0 +1,20 @@
+"""Start the dashboard with its data warm-up and status server.
+
+Equivalent to ``streamlit run app.py [options]``, except that the EM-DAT
+dataset starts loading and the readiness endpoint comes up as soon as the
+server process starts, rather than at the first page visit::
+
+    python serve.py --server.port=8501
+"""
+import sys
+
+from streamlit.web import cli as stcli
+
+from utils.server import start_server
+from utils.warmup import start_warmup
+
+if __name__ == "__main__":
+    start_warmup()
+    start_server()
+    sys.argv = ["streamlit", "run", "app.py", *sys.argv[1:]]
+    sys.exit(stcli.main())
@@ -0,0 +1,237 @@
+"""Per-view aggregation stages computed from the filtered cube.
+
+Each stage computes everything its view can display in one go, for every
+control value, and is cached per dataset version and filter state: moving
+a view's controls then only selects from the cached result.
+"""
+import functools
+
+import pandas as pd
+
+from utils.cache import get_result_cache
+from utils.database import get_aggregates, get_aggregates_version, run_concurrently
+from utils.dataset import load_dataset
+from utils.filters import (
+    filter_key, get_filter_state, get_filtered_cube, uses_database_aggregates
+)
+from utils.geo import GeoHierarchy, is_mappable
+from utils.metrics import instrumented
+
+# Variables shown by the views, as named in the cube
+VARIABLES = ['count', 'death', 'affected', 'damage']
+
+# Aggregations applied to yearly totals: the Map view's aggregators, per
+# country, and the Metric view's rows
+AGGREGATORS = {
+    'Total': 'sum',
+    'Yearly Average': 'mean',
+    'Yearly Median': 'median'
+}
+MAP_AGGREGATORS = METRIC_AGGREGATORS = AGGREGATORS
+
+
+# Time view stackings, by the cube dimension they split yearly bars on
+TIME_STACKINGS = {
+    None: None,
+    'Types': 'disaster_type',
+    'Regions': 'region',
+    'Subregions': 'subregion'
+}
+
+
+def cached_stage(name: str, filters: dict, compute):
+    """Return ``compute()`` through the result cache for the dataset version.
+
+    Cubes read from the database are not tied to a dataset version and are
+    cached by Streamlit already, so stages built on them are not.
+    """
+    if uses_database_aggregates(filters):
+        return compute()
+    key = (name, load_dataset().version, filter_key(filters))
+    return get_result_cache().get_or_compute(key, compute)
+
+
+def stage_cube(filters: dict, keys: list) -> pd.DataFrame:
+    """Return the filtered cube a stage grouping by ``keys`` is built on.
+
+    With the database aggregates, the cube summed by ``keys`` in Postgres
+    (see ``utils.database.get_aggregates``): stages group it again to the
+    same result, and only that rollup is transferred.
+    """
+    if uses_database_aggregates(filters):
+        return get_aggregates(filters, tuple(keys), get_aggregates_version())
+    return get_filtered_cube(filters)
+
+
+def gather_stages(filters: dict, *stages) -> list:
+    """Return the result of each stage function for ``filters``.
+
+    With the database aggregates every stage is an independent Postgres
+    query, run concurrently (see ``utils.database.run_concurrently``). In
+    memory they are computed one after the other from the same filtered
+    cube, on which running them in threads would only contend.
+    """
+    calls = [functools.partial(stage, filters) for stage in stages]
+    if uses_database_aggregates(filters):
+        return run_concurrently(*calls)
+    return [call() for call in calls]
+
+
+def get_year_range(filters: dict = None) -> tuple[int, int]:
+    """Return the first start year and last end year of the filtered events."""
+    if filters is None:
+        filters = get_filter_state()
+    years = stage_cube(filters, ['start_year', 'end_year'])
+    return int(years['start_year'].min()), int(years['end_year'].max())
+
+
+def map_aggregates(cube: pd.DataFrame, geo: GeoHierarchy = None) -> dict:
+    """
+    Parameters
+    ----------
+    cube : pd.DataFrame
+        Filtered aggregate cube, see ``utils.cube``.
+    geo : GeoHierarchy, optional
+        Geographic hierarchy of the dataset the cube was built from. Its
+        ``places`` give each country's region, ISO code and whether plotly
+        can draw it, so the cube is only grouped by country. Without it, they
+        are grouped on and resolved from the cube.
+
+    Returns
+    -------
+    dict
+        One frame per :data:`MAP_AGGREGATORS` label with a row per country
+        and a column per :data:`VARIABLES`. Averages and medians are taken
+        over the years with at least one event. A ``mappable`` column flags
+        the countries plotly can draw.
+    """
+    keys = ['country'] if geo is not None else ['country', 'region', 'iso']
+    annual = cube.groupby(
+        [*keys, 'start_year']
+    ).agg(
+        count=('rows', 'sum'),
+        death=('death', 'sum'),
+        affected=('affected', 'sum'),
+        damage=('damage', 'sum')
+    )
+    stats = annual.groupby(keys)[VARIABLES].agg(
+        list(MAP_AGGREGATORS.values())
+    )
+    if geo is not None:
+        places = geo.places.reindex(stats.index)
+
+    result = {}
+    for label, func in MAP_AGGREGATORS.items():
+        data = stats.xs(func, axis=1, level=1)
+        if geo is not None:
+            data = data.assign(
+                region=places['region'],
+                iso=places['iso'],
+                mappable=places['mappable'].fillna(False).astype(bool)
+            ).reset_index()
+            data = data[['country', 'region', 'iso', *VARIABLES, 'mappable']]
+        else:
+            data = data.reset_index()
+            data['mappable'] = data['iso'].map(is_mappable)
+        result[label] = data
+    return result
+
+
+@instrumented('stage.map')
+def get_map_aggregates(filters: dict = None) -> dict:
+    """Return :func:`map_aggregates` for the current filters."""
+    if filters is None:
+        filters = get_filter_state()
+
+    def compute():
+        if uses_database_aggregates(filters):
+            keys = ['country', 'region', 'iso', 'start_year']
+            return map_aggregates(stage_cube(filters, keys))
+        return map_aggregates(get_filtered_cube(filters), load_dataset().geo)
+
+    return cached_stage('map', filters, compute)
+
+
+def metric_table(cube: pd.DataFrame) -> dict:
+    """
+    Parameters
+    ----------
+    cube : pd.DataFrame
+        Filtered aggregate cube, see ``utils.cube``.
+
+    Returns
+    -------
+    dict
+        - ``summary``: a row per :data:`METRIC_AGGREGATORS` label plus
+          ``Reporting %`` (the share of events reporting each impact), and
+          a column per :data:`VARIABLES`. ``count`` is the number of
+          distinct DisNo. and has no reporting share.
+        - ``distribution``: a row per disaster type with the percentage of
+          the events and of each impact it accounts for, to one decimal.
+    """
+    impacts = VARIABLES[1:]
+    yearly = cube.groupby('start_year')[['disno', *impacts]].sum().rename(
+        columns={'disno': 'count'}
+    )
+    summary = yearly.agg(list(METRIC_AGGREGATORS.values()))
+    summary.index = list(METRIC_AGGREGATORS)
+    reported = cube[[f'{name}_reported' for name in impacts]].sum().to_numpy()
+    rows = cube['rows'].sum()
+    # No share at all when no event matches, rather than dividing by zero
+    shares = reported / rows * 100 if rows else [float('nan')] * len(impacts)
+    summary.loc['Reporting %'] = [float('nan'), *shares]
+
+    distribution = cube.groupby('disaster_type').agg(
+        count=('rows', 'sum'),
+        death=('death', 'sum'),
+        affected=('affected', 'sum'),
+        damage=('damage', 'sum')
+    )
+    distribution = (distribution / distribution.sum() * 100).round(1).reset_index()
+
+    return {'summary': summary, 'distribution': distribution}
+
+
+@instrumented('stage.metric')
+def get_metric_table(filters: dict = None) -> dict:
+    """Return :func:`metric_table` for the current filters."""
+    if filters is None:
+        filters = get_filter_state()
+    keys = ['start_year', 'disaster_type']
+    return cached_stage('metric', filters, lambda: metric_table(stage_cube(filters, keys)))
+
+
+def time_series(cube: pd.DataFrame) -> dict:
+    """
+    Parameters
+    ----------
+    cube : pd.DataFrame
+        Filtered aggregate cube, see ``utils.cube``.
+
+    Returns
+    -------
+    dict
+        One frame per :data:`TIME_STACKINGS` label with the yearly totals of
+        every :data:`VARIABLES`, per value of the stacking dimension if any.
+        All are rolled up from a single grouping of the cube by year and
+        every stacking dimension.
+    """
+    dimensions = [d for d in TIME_STACKINGS.values() if d is not None]
+    base = cube.groupby(
+        ['start_year', *dimensions], dropna=False, sort=False
+    )[VARIABLES].sum().reset_index()
+
+    result = {}
+    for label, dimension in TIME_STACKINGS.items():
+        keys = ['start_year'] if dimension is None else ['start_year', dimension]
+        result[label] = base.groupby(keys)[VARIABLES].sum().reset_index()
+    return result
+
+
+@instrumented('stage.time')
+def get_time_series(filters: dict = None) -> dict:
+    """Return :func:`time_series` for the current filters."""
+    if filters is None:
+        filters = get_filter_state()
+    keys = ['start_year', *(d for d in TIME_STACKINGS.values() if d is not None)]
+    return cached_stage('time', filters, lambda: time_series(stage_cube(filters, keys)))
@@ -0,0 +1,267 @@
+"""Headless access to the dashboard's aggregates over HTTP.
+
+Routes served by the status server (see ``utils.server``):
+
+- ``/api/metric``: tables ``summary`` and ``distribution`` of the Metric view,
+- ``/api/map``: a table per Map view aggregator, a row per country,
+- ``/api/time``: a table per Time view stacking, a row per year (and value).
+
+They take the sidebar filters as query parameters (``start``, ``end``,
+``classification_key``, ``region``, ``subregion``, ``country``, and
+``active_from``/``active_to`` ISO dates for events active during a period),
+defaulting to the full dataset, and reuse the in-process dataset and result
+cache.
+``table`` selects one table. Responses are JSON, or an Arrow IPC stream of
+one table (the first by default) with ``format=arrow`` or an ``Accept:
+application/vnd.apache.arrow.stream`` header.
+
+Each response has an ETag derived from the version of the data it is
+computed from and the request, so polling with ``If-None-Match`` answers 304
+without computing anything until the data changes. With
+``EMVIEW_AGGREGATES=database`` that is the version of the materialized
+views, which changes with each refresh, and answering does not need the
+dataset loaded unless the filters do.
+"""
+import hashlib
+import json
+import logging
+import re
+from datetime import date
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+import pyarrow as pa
+
+from utils.aggregates import (
+    MAP_AGGREGATORS, TIME_STACKINGS, get_map_aggregates, get_metric_table,
+    get_time_series
+)
+from utils.cache import get_result_cache
+from utils.database import AGGREGATES, get_aggregates_version
+from utils.dataset import get_dataset, load_dataset
+from utils.filters import (
+    default_filters, filter_key, get_filter_options, uses_database_aggregates
+)
+
+logger = logging.getLogger(__name__)
+
+ARROW_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+JSON_CONTENT_TYPE = 'application/json'
+
+
+def parse_key(value: str) -> str:
+    """Return a classification key pattern, checked to compile as a regex."""
+    key = value.strip()
+    try:
+        re.compile(key.replace('*', '.*'))
+    except re.error:
+        raise ValueError(f"invalid pattern {key!r}") from None
+    return key
+
+
+# Query parameters holding the sidebar filters, and their parsers
+FILTER_PARAMETERS = {
+    'start': int,
+    'end': int,
+    'classification_key': parse_key,
+    'region': str,
+    'subregion': str,
+    'country': str
+}
+
+# Name of the unstacked Time view table
+UNSTACKED = 'Unstacked'
+
+
+def metric_tables(filters: dict) -> dict:
+    tables = get_metric_table(filters)
+    return {
+        'summary': tables['summary'].reset_index(names='statistic'),
+        'distribution': tables['distribution']
+    }
+
+
+def map_tables(filters: dict) -> dict:
+    tables = get_map_aggregates(filters)
+    return {label: tables[label] for label in MAP_AGGREGATORS}
+
+
+def time_tables(filters: dict) -> dict:
+    tables = get_time_series(filters)
+    return {
+        UNSTACKED if label is None else label: tables[label]
+        for label in TIME_STACKINGS
+    }
+
+
+# Endpoint -> function returning its tables for a filter state
+ENDPOINTS = {
+    'metric': metric_tables,
+    'map': map_tables,
+    'time': time_tables
+}
+
+
+class BadRequest(ValueError):
+    """A query parameter has an invalid value."""
+
+
+def parse_filters(query: dict, defaults: dict) -> dict:
+    """Return the filter state of the query parameters over ``defaults``."""
+    filters = dict(defaults)
+    for name, parse in FILTER_PARAMETERS.items():
+        values = query.get(name)
+        if not values or not values[-1].strip():
+            continue
+        try:
+            filters[name] = parse(values[-1])
+        except ValueError:
+            raise BadRequest(f"invalid value for {name}: {values[-1]!r}") from None
+    if filters['start'] > filters['end']:
+        raise BadRequest("start is after end")
+
+    # Events active during the period, bounded by the years if one is missing
+    period = [query.get(name, [''])[-1].strip() for name in ('active_from', 'active_to')]
+    if any(period):
+        try:
+            first = date.fromisoformat(period[0]) if period[0] else date(filters['start'], 1, 1)
+            last = date.fromisoformat(period[1]) if period[1] else date(filters['end'], 12, 31)
+        except ValueError:
+            raise BadRequest(f"invalid active_from or active_to: {period}") from None
+        if first > last:
+            raise BadRequest("active_from is after active_to")
+        filters['period'] = (first.isoformat(), last.isoformat())
+    return filters
+
+
+def encode_json(version: str, filters: dict, tables: dict) -> bytes:
+    """Return the tables as a JSON document of records, NaN as null."""
+    parts = ', '.join(
+        f'{json.dumps(name)}: {table.to_json(orient="records")}'
+        for name, table in tables.items()
+    )
+    return (
+        f'{{"version": {json.dumps(version)}, "filters": {json.dumps(filters)}, '
+        f'"tables": {{{parts}}}}}'
+    ).encode()
+
+
+def encode_arrow(table: pd.DataFrame) -> bytes:
+    """Return the table as an Arrow IPC stream."""
+    arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, arrow_table.schema) as writer:
+        writer.write_table(arrow_table)
+    return sink.getvalue().to_pybytes()
+
+
+def make_etag(version: str, *parts) -> str:
+    digest = hashlib.sha1(repr((version, *parts)).encode()).hexdigest()[:16]
+    return f'"{version}-{digest}"'
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """Whether an ``If-None-Match`` header matches ``etag``."""
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return '*' in tags or etag in tags
+
+
+def error(code: int, message: str) -> tuple:
+    return code, {'error': message}
+
+
+def get_defaults() -> dict | None:
+    """Return the default filters, None if there is no data to answer from.
+
+    From the dataset once loaded; with the database aggregates, from the
+    sidebar's summary query before that.
+    """
+    dataset = get_dataset()
+    if dataset is not None:
+        return default_filters(dataset)
+    if AGGREGATES == 'database':
+        options = get_filter_options()
+        if options is not None:
+            return options[1]
+    return None
+
+
+def get_version(filters: dict) -> str | None:
+    """Return the version of the data the tables for ``filters`` come from.
+
+    The materialized views' when they answer for ``filters``, else the
+    dataset's, loaded on demand with the database aggregates (the warm-up
+    does not load it then). None if the dataset is not loaded yet.
+    """
+    if uses_database_aggregates(filters):
+        return get_aggregates_version()
+    dataset = get_dataset()
+    if dataset is None and AGGREGATES == 'database':
+        dataset = load_dataset()
+    return None if dataset is None else dataset.version
+
+
+def serve(handler, endpoint: str) -> tuple:
+    """Answer a request for ``endpoint`` on the status server.
+
+    Returns the HTTP status, the body (bytes or a JSON-serializable error)
+    and the response headers.
+    """
+    defaults = get_defaults()
+    if defaults is None:
+        return error(503, 'dataset not loaded yet')
+
+    query = parse_qs(urlsplit(handler.path).query)
+    try:
+        filters = parse_filters(query, defaults)
+    except BadRequest as e:
+        return error(400, str(e))
+
+    try:
+        version = get_version(filters)
+    except Exception:
+        logger.warning("Loading the EM-DAT data failed", exc_info=True)
+        version = None
+    if version is None:
+        return error(503, 'dataset not loaded yet')
+
+    table = query.get('table', [None])[-1]
+    arrow = (
+        query.get('format', [''])[-1] == 'arrow'
+        or ARROW_CONTENT_TYPE in handler.headers.get('Accept', '')
+    )
+    fmt = 'arrow' if arrow else 'json'
+
+    etag = make_etag(version, endpoint, filter_key(filters), table, fmt)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(handler.headers.get('If-None-Match'), etag):
+        return 304, b'', headers
+
+    def compute():
+        tables = ENDPOINTS[endpoint](filters)
+        if table is not None:
+            if table not in tables:
+                raise BadRequest(f"unknown table {table!r}, expected one of {list(tables)}")
+            tables = {table: tables[table]}
+        if arrow:
+            return encode_arrow(next(iter(tables.values())))
+        return encode_json(version, filters, tables)
+
+    # Encoded responses are cached too: the same dashboards poll the same
+    # filters, and encoding is a sizeable part of a warm request
+    key = ('api', version, endpoint, filter_key(filters), table, fmt)
+    try:
+        body = get_result_cache().get_or_compute(key, compute)
+    except BadRequest as e:
+        return error(400, str(e))
+    headers['Content-Type'] = ARROW_CONTENT_TYPE if arrow else JSON_CONTENT_TYPE
+    return 200, body, headers
+
+
+# Status server routes, see ``utils.server``
+ROUTES = {
+    f'/api/{endpoint}': (lambda handler, endpoint=endpoint: serve(handler, endpoint))
+    for endpoint in ENDPOINTS
+}
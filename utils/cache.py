@@ -0,0 +1,140 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from utils.shared import SHARED_KINDS, SharedCache, get_shared_cache
+
+# Byte budget of the process-wide result cache
+RESULT_CACHE_MB = int(os.getenv("EMVIEW_RESULT_CACHE_MB", "256"))
+
+
+def sizeof(value) -> int:
+    """
+    Parameters
+    ----------
+    value : object
+        A cached result: frame, series, array, Arrow table or a container
+        of those.
+
+    Returns
+    -------
+    int
+        Approximate number of bytes held by ``value``. Frames are measured
+        shallowly: object columns of a filtered frame point to the strings
+        of the shared dataset, so only the pointers are extra memory.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=False))
+    if isinstance(value, (np.ndarray, pa.Table)):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """Thread-safe LRU cache bounded by the bytes of the values it holds.
+
+    Keys must be hashable and should include the dataset version so that
+    results computed on a previous snapshot are never served; they simply
+    age out of the cache.
+
+    With a ``shared`` tier, results whose key kind (first element) is in
+    ``SHARED_KINDS`` are looked up there on a local miss and published
+    there once computed, see ``utils.shared``.
+    """
+
+    def __init__(self, max_bytes: int, shared: SharedCache = None):
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for ``key``, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size: int = None) -> None:
+        """Store ``value`` under ``key``, evicting least recently used entries.
+
+        ``size`` overrides the measured size, e.g. 0 for a value that only
+        references memory owned by someone else. Values larger than the
+        whole budget are not stored.
+        """
+        if size is None:
+            size = sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[1]
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for ``key``, computing and storing it on a miss."""
+        value = self.get(key)
+        if value is None:
+            shared = self.shared if key[0] in SHARED_KINDS else None
+            if shared is not None:
+                value = shared.load(key)
+            if value is None:
+                value = compute()
+                if shared is not None:
+                    shared.save(key, value)
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> dict:
+        """Return the counters used to size the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'entries': len(self._entries),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
+        if self.shared is not None:
+            stats.update(self.shared.stats())
+        return stats
+
+
+@st.cache_resource
+def get_result_cache() -> ResultCache:
+    """Return the process-wide result cache."""
+    return ResultCache(RESULT_CACHE_MB * 1024 * 1024, get_shared_cache())
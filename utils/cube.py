@@ -0,0 +1,81 @@
+import pandas as pd
+
+# Dimensions the cube is rolled up on: every sidebar filter except the
+# classification key, plus what the Metric, Map and Time views group by
+DIMENSIONS = [
+    'start_year',
+    'end_year',
+    'region',
+    'subregion',
+    'country',
+    'iso',
+    'disaster_type'
+]
+
+# Impact columns summed in the cube, by their short name in the views
+IMPACTS = {
+    'death': 'total_deaths',
+    'affected': 'total_affected',
+    'damage': 'total_damage_adjusted_usd_thousands'
+}
+
+# Measures of each cell, see build_cube; all of them add up across cells
+MEASURES = ['rows', 'count', 'disno'] + [
+    measure for name in IMPACTS for measure in (name, f'{name}_reported')
+]
+
+
+def build_cube(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parameters
+    ----------
+    data : pd.DataFrame
+        EM-DAT events, one row per disaster and country.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per combination of :data:`DIMENSIONS` present in ``data``
+        with the measures
+
+        - ``rows``: number of events,
+        - ``count``: number of events with a DisNo.,
+        - ``disno``: number of distinct DisNo.,
+        - ``death``, ``affected``, ``damage``: impact totals,
+        - ``death_reported``, ...: number of events reporting the impact.
+
+        A DisNo. always falls in a single cell, so ``disno`` can be summed
+        across cells to get distinct counts of any rollup. Categorical
+        dimensions are returned as plain values, so rollups of the cube need
+        no ``observed=True``.
+    """
+    aggs = {
+        'rows': ('disno', 'size'),
+        'count': ('disno', 'count'),
+        'disno': ('disno', 'nunique')
+    }
+    for name, col in IMPACTS.items():
+        aggs[name] = (col, 'sum')
+        aggs[f'{name}_reported'] = (col, 'count')
+
+    cube = data.groupby(
+        DIMENSIONS, dropna=False, observed=True, sort=False
+    ).agg(**aggs).reset_index()
+
+    categorical = {
+        name: cube[name].astype(object) for name in DIMENSIONS
+        if isinstance(cube[name].dtype, pd.CategoricalDtype)
+    }
+    return cube.assign(**categorical)
+
+
+def filter_cube(cube: pd.DataFrame, filters: dict) -> pd.DataFrame:
+    """Apply the year and geographic sidebar filters to a cube.
+
+    The classification key is not a cube dimension and is ignored here.
+    """
+    mask = (cube['start_year'] >= filters['start']) & (cube['end_year'] <= filters['end'])
+    for name in ('region', 'subregion', 'country'):
+        if filters.get(name):
+            mask &= cube[name] == filters[name]
+    return cube[mask]
@@ -1,8 +1,24 @@
+import asyncio
+import hashlib
 import os
-from sqlalchemy import create_engine
+import threading
+from contextlib import contextmanager
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from sqlalchemy import (
+    URL, BigInteger, Integer, cast, column, create_engine, func, literal_column,
+    select, table, text
+)
 from dotenv import load_dotenv
 import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from utils.cube import DIMENSIONS, IMPACTS, MEASURES
+from utils.metrics import instrumented
+from utils.schema import apply_schema, load_with_schema
 
 load_dotenv()
 
@@ -12,25 +28,439 @@ DB_HOST = os.getenv("POSTGRES_HOST")
 DB_PORT = os.getenv("POSTGRES_PORT")
 DB_NAME = os.getenv("POSTGRES_DB")
 
-# SQLAlchemy engine
-DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# Optional read replica, with the same credentials and database: every
+# read of this module goes there, writes (utils.matviews) stay on the primary
+DB_REPLICA_HOST = os.getenv("POSTGRES_REPLICA_HOST")
+DB_REPLICA_PORT = os.getenv("POSTGRES_REPLICA_PORT", DB_PORT)
+
+# Connection pool, per engine, and timeouts (seconds; the statement timeout
+# is in milliseconds and does not apply to full-table loads, 0 disables it)
+POOL_SIZE = int(os.getenv("EMVIEW_DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("EMVIEW_DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = int(os.getenv("EMVIEW_DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("EMVIEW_DB_POOL_RECYCLE", "1800"))
+CONNECT_TIMEOUT = int(os.getenv("EMVIEW_DB_CONNECT_TIMEOUT", "10"))
+STATEMENT_TIMEOUT_MS = int(os.getenv("EMVIEW_DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+# Incremental refresh: rows are identified by KEY_COLUMN, which must be
+# unique (the table is reloaded in full otherwise), and changes are
+# detected through WATERMARK_COLUMN (a last-update timestamp)
+KEY_COLUMN = os.getenv("EMVIEW_KEY_COLUMN", "disno")
+WATERMARK_COLUMN = os.getenv("EMVIEW_WATERMARK_COLUMN", "last_update")
+
+# Columns loaded up front: what the sidebar filters and the Metric, Map and
+# Time views use. Other columns are fetched on demand (get_column_data).
+CORE_COLUMNS = list(dict.fromkeys([
+    KEY_COLUMN,
+    'classification_key',
+    'disaster_type',
+    'country',
+    'iso',
+    'region',
+    'subregion',
+    'start_year',
+    'end_year',
+    'start_date',
+    'end_date',
+    'total_deaths',
+    'total_affected',
+    'total_damage_adjusted_usd_thousands',
+    WATERMARK_COLUMN
+]))
+
+# How the full table is read: "copy" streams COPY ... TO STDOUT into Arrow
+# column batches, "sql" goes through pandas.read_sql_query
+LOADER = os.getenv("EMVIEW_LOADER", "copy")
+
+# Where the chart aggregates come from: "memory" (the shared dataset) or
+# "database" (the materialized views of utils.matviews)
+AGGREGATES = os.getenv("EMVIEW_AGGREGATES", "memory")
+
+def make_engine(host: str, port: str):
+    """Create a pooled engine for the EM-DAT database on ``host``.
+
+    Connections are only opened on use, so the app can run from a local
+    snapshot without any database settings.
+    """
+    url = URL.create(
+        "postgresql+psycopg2",
+        username=DB_USER,
+        password=DB_PASS,
+        host=host,
+        port=int(port) if port else None,
+        database=DB_NAME
+    )
+    connect_args = {'connect_timeout': CONNECT_TIMEOUT}
+    if STATEMENT_TIMEOUT_MS:
+        connect_args['options'] = f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"
+    return create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_size=POOL_SIZE,
+        max_overflow=POOL_MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        connect_args=connect_args
+    )
+
+# SQLAlchemy engines: the primary, and the one reads are routed to
+engine = make_engine(DB_HOST, DB_PORT)
+read_engine = make_engine(DB_REPLICA_HOST, DB_REPLICA_PORT) if DB_REPLICA_HOST else engine
+
+EMDATA_TABLE = table("emdata_hist", schema="public")
+CUBE_TABLE = table("emview_cube", schema="public")
+
+# Single row holding when the materialized views were last built or
+# refreshed (see utils.matviews), which versions the database aggregates
+REFRESH_TABLE = "public.emview_refresh"
+
+# Seconds the version of the database aggregates is cached: how long a
+# refresh of the views may go unnoticed
+AGGREGATES_VERSION_TTL = 60
+
+# Materialized aggregate views (see utils.matviews) by their dimensions,
+# narrowest first: yearly rollups by type and by country, then the full cube.
+# Both rollups keep the dimensions the year and geographic filters need.
+AGGREGATE_VIEWS = {
+    'emview_type_year': ['start_year', 'end_year', 'region', 'subregion', 'disaster_type'],
+    'emview_country_year': ['start_year', 'end_year', 'region', 'subregion', 'country', 'iso'],
+    'emview_cube': DIMENSIONS
+}
+
+# Postgres column types -> Arrow types used to parse COPY output. Anything
+# else is read as text.
+ARROW_TYPES = {
+    'smallint': pa.int16(),
+    'integer': pa.int32(),
+    'bigint': pa.int64(),
+    'real': pa.float32(),
+    'double precision': pa.float64(),
+    'numeric': pa.float64(),
+    'boolean': pa.bool_(),
+    'date': pa.date32(),
+    'timestamp without time zone': pa.timestamp('us'),
+    'timestamp with time zone': pa.timestamp('us', tz='UTC')
+}
+
+@contextmanager
+def bulk_connection():
+    """Read connection for full-table reads, exempt from the statement timeout."""
+    with read_engine.begin() as conn:
+        conn.exec_driver_sql("SET LOCAL statement_timeout = 0")
+        yield conn
+
+async def gather_queries(*calls) -> list:
+    """Run blocking query functions concurrently and return their results.
+
+    Each call runs in a worker thread with its own pooled connection (the
+    driver releases the GIL while waiting on Postgres), so the total wait
+    is that of the slowest query rather than their sum. The worker threads
+    run in the caller's script run context, so that cached calls behave as
+    in the script thread.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+
+    def in_context(call):
+        def run():
+            if ctx is not None:
+                add_script_run_ctx(threading.current_thread(), ctx)
+            return call()
+        return run
+
+    return list(await asyncio.gather(
+        *(asyncio.to_thread(in_context(call)) for call in calls)
+    ))
+
+def run_concurrently(*calls) -> list:
+    """Blocking entry point to :func:`gather_queries` for script and worker threads."""
+    return asyncio.run(gather_queries(*calls))
+
+def get_core_columns(table_columns: list) -> list:
+    """Return the :data:`CORE_COLUMNS` present in the table, in table order."""
+    return [c for c in table_columns if c in CORE_COLUMNS]
+
+@instrumented('load.full_data')
+def get_full_data(columns: list = None):
+    """Load every row of the EM-DAT table with the schema of ``utils.schema``.
+
+    Only ``columns`` are read, by default the core columns. Not cached
+    here: the result is held once per process by
+    ``utils.dataset.DatasetStore`` and shared by every session.
+    """
+    if columns is None:
+        columns = get_core_columns(get_table_columns())
+    if LOADER == 'copy':
+        return load_with_schema(copy_full_data(columns))
+    query = select(*[column(c) for c in columns]).select_from(EMDATA_TABLE)
+    with bulk_connection() as conn:
+        return load_with_schema(pd.read_sql_query(query, conn))
+
+def get_column_types() -> dict:
+    """Return the Arrow type of each column of the EM-DAT table, in table order."""
+    query = text(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_schema = 'public' AND table_name = 'emdata_hist' "
+        "ORDER BY ordinal_position"
+    )
+    with read_engine.connect() as conn:
+        return {
+            name: ARROW_TYPES.get(data_type, pa.string())
+            for name, data_type in conn.execute(query)
+        }
+
+def copy_full_data(columns: list = None, block_size: int = 1 << 22) -> pd.DataFrame:
+    """
+    Parameters
+    ----------
+    columns : list, optional
+        Columns to read, all by default.
+    block_size : int, optional
+        Bytes of CSV parsed per Arrow record batch.
+
+    Returns
+    -------
+    pd.DataFrame
+        The EM-DAT table, read with ``COPY ... TO STDOUT``. The CSV stream
+        goes through an OS pipe straight into Arrow's streaming CSV reader,
+        so neither the whole CSV text nor per-row Python objects are ever
+        held in memory; columns are built batch by batch.
+    """
+    column_types = get_column_types()
+    if columns is not None:
+        column_types = {c: column_types[c] for c in columns}
+    quote = read_engine.dialect.identifier_preparer.quote
+    query = (
+        f"SELECT {', '.join(quote(c) for c in column_types)} "
+        f"FROM public.emdata_hist"
+    )
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def produce():
+        # The sink is closed on every path, failures included, so that the
+        # reader always gets end-of-file instead of waiting forever
+        with os.fdopen(write_fd, 'wb') as sink:
+            conn = None
+            try:
+                conn = read_engine.raw_connection()
+                cursor = conn.cursor()
+                # Rolled back with the transaction when the connection is released
+                cursor.execute("SET LOCAL statement_timeout = 0")
+                cursor.copy_expert(
+                    f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)",
+                    sink
+                )
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    producer = threading.Thread(target=produce, name="emview-copy", daemon=True)
+    producer.start()
+    try:
+        with os.fdopen(read_fd, 'rb') as source:
+            reader = pacsv.open_csv(
+                source,
+                read_options=pacsv.ReadOptions(block_size=block_size),
+                convert_options=pacsv.ConvertOptions(
+                    column_types=column_types,
+                    strings_can_be_null=True,
+                    quoted_strings_can_be_null=False
+                )
+            )
+            table = reader.read_all()
+    except Exception as exc:
+        producer.join()
+        # A failed COPY surfaces as an empty or truncated stream to the
+        # reader: report the database error, chained to the reader's
+        if errors:
+            raise errors[0] from exc
+        raise
+    producer.join()
+    if errors:
+        raise errors[0]
+    return table.to_pandas(coerce_temporal_nanoseconds=True)
+
+def get_table_columns() -> list:
+    """Return the column names of the EM-DAT table in table order."""
+    query = text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = 'public' AND table_name = 'emdata_hist' "
+        "ORDER BY ordinal_position"
+    )
+    with read_engine.connect() as conn:
+        return list(conn.execute(query).scalars())
+
+def get_changed_data(watermark, columns: list = None):
+    """Load the rows inserted or updated at or after ``watermark``.
+
+    The comparison is inclusive so that rows written in the same instant as
+    the previous load are not missed; they are de-duplicated on merge.
+    """
+    selected = [column(c) for c in columns] if columns else [literal_column("*")]
+    query = select(*selected).select_from(EMDATA_TABLE).where(
+        column(WATERMARK_COLUMN) >= watermark
+    )
+    with bulk_connection() as conn:
+        return apply_schema(pd.read_sql_query(query, conn))
+
+def get_column_data(name: str) -> pd.Series:
+    """Fetch one non-core column for every row, indexed by the row key."""
+    query = select(column(KEY_COLUMN), column(name)).select_from(EMDATA_TABLE)
+    with bulk_connection() as conn:
+        data = apply_schema(pd.read_sql_query(query, conn))
+    return data.set_index(KEY_COLUMN)[name]
+
+def get_keys() -> pd.Series:
+    """Return every row key currently in the table (used to spot deletions)."""
+    query = f"SELECT {KEY_COLUMN} FROM public.emdata_hist"
+    with bulk_connection() as conn:
+        return pd.read_sql_query(query, conn)[KEY_COLUMN]
+
+@st.cache_data(ttl=600)
+def get_filter_summary() -> pd.DataFrame:
+    """Summarize what the sidebar filters need, without loading the table.
+
+    A row per region, subregion, country and ISO code, with the number of
+    events, the first and last start year and the last end year.
+    """
+    geography = [column(c) for c in ('region', 'subregion', 'country', 'iso')]
+    query = select(
+        *geography,
+        func.count().label('rows'),
+        func.min(column('start_year')).label('first_year'),
+        func.max(column('start_year')).label('last_year'),
+        func.max(column('end_year')).label('last_end_year')
+    ).select_from(EMDATA_TABLE).group_by(*geography)
+    return pd.read_sql_query(query, read_engine)
+
+def build_filtered_query(filters: dict, columns: list = None, source=EMDATA_TABLE):
+    """
+    Parameters
+    ----------
+    filters : dict
+        Sidebar filter state with keys ``start``, ``end``,
+        ``classification_key``, ``region``, ``subregion``, ``country`` and
+        ``period``. Missing or empty values are not filtered on.
+    columns : list, optional
+        Columns to fetch. All columns are fetched by default.
+    source : sqlalchemy.sql.TableClause, optional
+        Table or view to query, the EM-DAT table by default.
+
+    Returns
+    -------
+    sqlalchemy.sql.Select
+        A SELECT with the same semantics as ``utils.filters.filter_data``.
+        Every value is sent as a bound parameter and column names are quoted
+        by SQLAlchemy, so user input never reaches the SQL text.
+    """
+    selected = [column(c) for c in columns] if columns else [literal_column("*")]
+    query = select(*selected).select_from(source)
+
+    if filters.get('period'):
+        # Events active during the period, dates falling back to their years
+        # as in ``utils.index.event_days``
+        start = func.coalesce(
+            column('start_date'), func.make_date(cast(column('start_year'), Integer), 1, 1)
+        )
+        end = func.coalesce(
+            column('end_date'), func.make_date(cast(column('end_year'), Integer), 12, 31)
+        )
+        first, last = (date.fromisoformat(day) for day in filters['period'])
+        # greatest() skips NULLs: an unknown end must not become the start
+        query = query.where(
+            start <= last, end.isnot(None), func.greatest(end, start) >= first
+        )
+    else:
+        if filters.get('start') is not None:
+            query = query.where(column('start_year') >= filters['start'])
+        if filters.get('end') is not None:
+            query = query.where(column('end_year') <= filters['end'])
+    if filters.get('classification_key'):
+        # Same wildcard semantics as the in-memory filter (POSIX regex)
+        pattern = filters['classification_key'].replace('*', '.*')
+        query = query.where(column('classification_key').regexp_match(pattern))
+    for name in ('region', 'subregion', 'country'):
+        if filters.get(name):
+            query = query.where(column(name) == filters[name])
+    return query
+
+def estimate_selectivity(filters: dict) -> float:
+    """Estimate the fraction of rows matching ``filters``.
+
+    Uses the Postgres planner's row estimate for the filtered query against
+    the table statistics, so nothing is scanned.
+    """
+    compiled = build_filtered_query(filters).compile(dialect=read_engine.dialect)
+
+    def explain():
+        with read_engine.connect() as conn:
+            return conn.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+            ).scalar()
+
+    def reltuples():
+        with read_engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT reltuples FROM pg_class "
+                "WHERE oid = 'public.emdata_hist'::regclass"
+            )).scalar()
+
+    plan, total = run_concurrently(explain, reltuples)
+    if not total or total <= 0:
+        return 1.0
+    return min(plan[0]['Plan']['Plan Rows'] / total, 1.0)
 
 @st.cache_data(ttl=600)
-def get_full_data():
-    query = "SELECT * FROM public.emdata_hist"
-    return pd.read_sql_query(query, engine)
-
-def get_filtered_data(filters: dict):
-    """Optional later: SQL-based dynamic filtering."""
-    where_clauses = []
-    if filters.get('country'):
-        where_clauses.append(f"country = '{filters['country']}'")
-    if filters.get('start_year'):
-        where_clauses.append(f"start_date >= '{filters['start_year']}-01-01'")
-    if filters.get('end_year'):
-        where_clauses.append(f"end_date <= '{filters['end_year']}-12-31'")
-
-    where_clause = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-    query = f"SELECT * FROM public.emdata_hist {where_clause}"
-    return pd.read_sql_query(query, engine)
+def get_filtered_data(filters: dict, columns: list = None) -> pd.DataFrame:
+    """Fetch only the rows (and columns) matching the sidebar filters."""
+    data = pd.read_sql_query(build_filtered_query(filters, columns), read_engine)
+    return apply_schema(data)
+
+@st.cache_data(ttl=AGGREGATES_VERSION_TTL, show_spinner=False)
+def get_aggregates_version() -> str:
+    """Return the version of the materialized views, from their last refresh."""
+    with read_engine.connect() as conn:
+        refreshed_at = conn.execute(text(f"SELECT refreshed_at FROM {REFRESH_TABLE}")).scalar()
+    return hashlib.sha1(str(refreshed_at).encode()).hexdigest()[:16]
+
+@st.cache_data(ttl=600)
+def get_aggregate_cube(filters: dict, version: str = None) -> pd.DataFrame:
+    """Fetch the cells of the ``emview_cube`` materialized view matching the filters.
+
+    Same layout as ``utils.cube.build_cube``. The classification key is not
+    a cube dimension and must be handled by the caller. ``version`` (see
+    :func:`get_aggregates_version`) only keys the cache, so that a refresh
+    of the views is not answered from it.
+    """
+    filters = {k: v for k, v in filters.items() if k != 'classification_key'}
+    query = build_filtered_query(filters, source=CUBE_TABLE)
+    return pd.read_sql_query(query, read_engine)
+
+@st.cache_data(ttl=600)
+def get_aggregates(filters: dict, keys: tuple, version: str = None) -> pd.DataFrame:
+    """Fetch the cube cells matching the filters, summed by ``keys``.
+
+    Read from the narrowest of :data:`AGGREGATE_VIEWS` with ``keys`` and the
+    filtered dimensions, and summed in Postgres: only a row per value of
+    ``keys`` is transferred, with every cube measure. The classification key
+    is not a dimension and must be handled by the caller. ``version`` keys
+    the cache, as for :func:`get_aggregate_cube`.
+    """
+    filters = {k: v for k, v in filters.items() if k != 'classification_key'}
+    needed = {*keys, 'start_year', 'end_year'}
+    needed.update(name for name in ('region', 'subregion', 'country') if filters.get(name))
+    view = next(name for name, dims in AGGREGATE_VIEWS.items() if needed <= set(dims))
+
+    groups = [column(k) for k in keys]
+    # Postgres sums integers as numeric: counts are cast back
+    measures = [
+        func.sum(column(m)) if m in IMPACTS else cast(func.sum(column(m)), BigInteger)
+        for m in MEASURES
+    ]
+    query = build_filtered_query(filters, source=table(view, schema='public'))
+    query = query.with_only_columns(
+        *groups, *(measure.label(m) for measure, m in zip(measures, MEASURES))
+    ).group_by(*groups)
+    return pd.read_sql_query(query, read_engine)
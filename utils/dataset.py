@@ -0,0 +1,357 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+
+import pandas as pd
+import streamlit as st
+
+from utils.cube import build_cube
+from utils.database import (
+    KEY_COLUMN, WATERMARK_COLUMN, get_changed_data, get_core_columns,
+    get_full_data, get_keys, get_table_columns, run_concurrently
+)
+from utils.geo import GeoHierarchy
+from utils.index import FilterIndex
+from utils.schema import apply_schema
+from utils.shared import SharedCache, get_shared_cache
+from utils.snapshot import read_snapshot, snapshot_exists, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# The shared frame is handed out to every session: with copy-on-write any
+# slice or derived frame gets its own buffers on write, never the shared ones.
+pd.set_option('mode.copy_on_write', True)
+
+# Seconds before the shared dataset is considered stale and reloaded
+DATA_TTL = 600
+
+# "database": Postgres, with the local snapshot as a fast start and fallback
+# "snapshot": the local snapshot file only, no database needed
+DATA_SOURCE = os.getenv("EMVIEW_DATA_SOURCE", "database")
+
+# Seconds a replica may hold the shared dataset load before another takes
+# over, and before it checks again for the dataset another replica loads
+SHARED_LOAD_TIMEOUT = 600
+SHARED_RETRY = 10
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """Immutable snapshot of the EM-DAT table shared by all sessions.
+
+    ``data`` holds the core columns only (see ``utils.database``);
+    ``columns`` lists every column of the table, the others being fetched
+    on demand.
+    """
+    data: pd.DataFrame
+    geo: GeoHierarchy
+    index: FilterIndex
+    cube: pd.DataFrame
+    version: str
+    loaded_at: float
+    watermark: object = None
+    columns: tuple = ()
+
+
+def dataset_version(data: pd.DataFrame) -> str:
+    """
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The EM-DAT frame to fingerprint.
+
+    Returns
+    -------
+    str
+        A short content hash identifying this version of the dataset. Two
+        loads of identical data share the same version.
+    """
+    digest = hashlib.sha1(
+        pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes()
+    )
+    digest.update(",".join(map(str, data.columns)).encode())
+    return digest.hexdigest()[:16]
+
+
+def get_watermark(data: pd.DataFrame):
+    """Return the latest last-update value in ``data``, or None if unknown."""
+    if WATERMARK_COLUMN not in data.columns:
+        return None
+    watermark = data[WATERMARK_COLUMN].max()
+    if pd.isna(watermark):
+        return None
+    if isinstance(watermark, pd.Timestamp):
+        watermark = watermark.to_pydatetime()
+    return watermark
+
+
+def make_dataset(data: pd.DataFrame, columns: list = None) -> Dataset:
+    """Wrap a freshly loaded frame into a shared, read-only snapshot.
+
+    ``columns`` lists every column of the table, ``data``'s by default.
+    """
+    data = data.reset_index(drop=True)
+    return Dataset(
+        data=data,
+        geo=GeoHierarchy(data),
+        index=FilterIndex(data),
+        cube=build_cube(data),
+        version=dataset_version(data),
+        loaded_at=time.time(),
+        watermark=get_watermark(data),
+        columns=tuple(data.columns if columns is None else columns)
+    )
+
+
+def merge_delta(
+        data: pd.DataFrame,
+        delta: pd.DataFrame,
+        keys: pd.Series) -> pd.DataFrame:
+    """
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The currently loaded EM-DAT frame.
+    delta : pd.DataFrame
+        Rows inserted or updated since the last load.
+    keys : pd.Series
+        Every key currently present in the table.
+
+    Returns
+    -------
+    pd.DataFrame
+        ``data`` with deleted rows dropped, updated rows replaced by their
+        new version and inserted rows appended, in the compact schema.
+
+    Rows are matched on ``KEY_COLUMN``, which must be unique in ``data``
+    and ``delta`` (see :func:`has_unique_keys`).
+    """
+    keep = data[KEY_COLUMN].isin(keys) & ~data[KEY_COLUMN].isin(delta[KEY_COLUMN])
+    delta = delta.reindex(columns=data.columns)
+    # Categories of the two parts may differ: concat falls back to plain
+    # values, which the schema turns back into categoricals
+    return apply_schema(pd.concat([data[keep], delta], ignore_index=True))
+
+
+def has_unique_keys(*frames: pd.DataFrame) -> bool:
+    """Whether ``KEY_COLUMN`` identifies a single row in each of ``frames``."""
+    return all(frame[KEY_COLUMN].is_unique for frame in frames)
+
+
+class DatasetStore:
+    """Hold the current dataset and swap it atomically on reload.
+
+    Readers always get a complete snapshot: a reload builds the new dataset
+    aside and replaces the reference in one assignment, so sessions still
+    holding the previous snapshot keep a consistent view of it.
+
+    With the database as source, the first load is served from the local
+    snapshot file when one exists and then brought up to date in the
+    background; if Postgres is unreachable the snapshot keeps being served.
+
+    With a ``shared`` cache tier, a single replica at a time queries the
+    database and publishes the result, which the others load from the
+    shared store instead (see ``utils.shared``).
+    """
+
+    def __init__(
+            self,
+            ttl: int = DATA_TTL,
+            source: str = DATA_SOURCE,
+            shared: SharedCache = None):
+        self.ttl = ttl
+        self.source = source
+        self.shared = shared
+        self._dataset = None
+        self._lock = threading.Lock()
+
+    @property
+    def dataset(self) -> Dataset | None:
+        """The current snapshot, or None if nothing has been loaded yet."""
+        return self._dataset
+
+    def is_stale(self) -> bool:
+        dataset = self._dataset
+        return dataset is None or time.time() - dataset.loaded_at > self.ttl
+
+    def _load_database(self) -> Dataset:
+        """Load the full table from Postgres and save it as the local snapshot."""
+        columns = get_table_columns()
+        dataset = make_dataset(get_full_data(get_core_columns(columns)), columns)
+        write_snapshot(dataset.data, columns=columns)
+        return dataset
+
+    def _load_shared(self, current: Dataset = None) -> Dataset | None:
+        """Return the dataset a replica published within the TTL, if any."""
+        if self.shared is None or self.source != 'database':
+            return None
+        version = self.shared.current_version()
+        if version is None:
+            return None
+        if current is not None and current.version == version:
+            return replace(current, loaded_at=time.time())
+        published = self.shared.fetch_dataset(version)
+        if published is None:
+            return None
+        dataset = make_dataset(*published)
+        write_snapshot(dataset.data, columns=dataset.columns)
+        return dataset
+
+    def _load_exclusive(self, load, current: Dataset = None) -> Dataset:
+        """Run the database ``load`` in one replica at a time and publish it.
+
+        While another replica holds the load, a refresh keeps serving
+        ``current`` and checks again shortly; a first load waits for the
+        published dataset, then loads on its own after a timeout.
+        """
+        if self.shared is None:
+            return load()
+        deadline = time.time() + SHARED_LOAD_TIMEOUT
+        while not self.shared.lock_dataset(SHARED_LOAD_TIMEOUT):
+            if current is not None:
+                return replace(current, loaded_at=time.time() - self.ttl + SHARED_RETRY)
+            if time.time() > deadline:
+                return load()
+            time.sleep(1)
+            dataset = self._load_shared()
+            if dataset is not None:
+                return dataset
+        try:
+            dataset = load()
+            self.shared.publish_dataset(dataset, self.ttl)
+            return dataset
+        finally:
+            self.shared.unlock_dataset()
+
+    def _load_initial(self) -> Dataset:
+        """First load: the shared dataset or local snapshot, else the database."""
+        dataset = self._load_shared()
+        if dataset is not None:
+            return dataset
+        if snapshot_exists():
+            dataset = make_dataset(*read_snapshot())
+            if self.source == 'database':
+                # Serve it right away, but have the next access refresh it
+                dataset = replace(dataset, loaded_at=0.0)
+            return dataset
+        if self.source == 'snapshot':
+            raise FileNotFoundError("No EM-DAT snapshot file to load from")
+        return self._load_exclusive(self._load_database)
+
+    def reload(self) -> Dataset:
+        """Load the full table and publish it as the new snapshot."""
+        with self._lock:
+            if self.source == 'snapshot':
+                self._dataset = make_dataset(*read_snapshot())
+            else:
+                self._dataset = self._load_exclusive(self._load_database)
+            return self._dataset
+
+    def _refresh(self) -> Dataset:
+        """Bring the current snapshot up to date.
+
+        Takes the dataset another replica published if there is a fresh
+        one, else updates it from the database.
+        """
+        dataset = self._dataset
+        shared = self._load_shared(dataset)
+        if shared is not None:
+            return shared
+        return self._load_exclusive(lambda: self._update(dataset), dataset)
+
+    def _update(self, dataset: Dataset) -> Dataset:
+        """Bring ``dataset`` up to date with the database.
+
+        Only rows changed since the snapshot's watermark are fetched, plus
+        the key column to detect deletions. Falls back to a full load when
+        there is no usable watermark, the table's columns have changed or
+        ``KEY_COLUMN`` does not identify rows uniquely.
+        """
+        if (dataset is None or dataset.watermark is None
+                or get_table_columns() != list(dataset.columns)):
+            return self._load_database()
+
+        delta, keys = run_concurrently(
+            lambda: get_changed_data(dataset.watermark, list(dataset.data.columns)),
+            get_keys
+        )
+
+        # A changed row can only be told from its siblings by a unique key
+        if not (keys.is_unique and has_unique_keys(dataset.data, delta)):
+            logger.warning(
+                "%s is not unique in the EM-DAT table, reloading it in full",
+                KEY_COLUMN
+            )
+            return self._load_database()
+
+        # The inclusive watermark always re-fetches the newest known rows;
+        # nothing changed if that is all we got and no key disappeared.
+        refetched = (
+            delta[KEY_COLUMN].isin(dataset.data[KEY_COLUMN])
+            & (delta[WATERMARK_COLUMN] == dataset.watermark)
+        )
+        deleted = ~dataset.data[KEY_COLUMN].isin(keys)
+        if refetched.all() and not deleted.any():
+            return replace(dataset, loaded_at=time.time())
+
+        dataset = make_dataset(
+            merge_delta(dataset.data, delta, keys), dataset.columns
+        )
+        write_snapshot(dataset.data, columns=dataset.columns)
+        return dataset
+
+    def _refresh_in_background(self) -> None:
+        """Refresh in a worker thread; the caller must hold the lock."""
+        def run():
+            try:
+                self._dataset = self._refresh()
+            except Exception:
+                logger.warning(
+                    "Refreshing the EM-DAT dataset failed, serving the loaded "
+                    "data until the next attempt", exc_info=True
+                )
+                self._dataset = replace(self._dataset, loaded_at=time.time())
+            finally:
+                self._lock.release()
+
+        threading.Thread(target=run, name="emview-refresh", daemon=True).start()
+
+    def get(self) -> Dataset:
+        """Return the current snapshot, loading or refreshing it if needed.
+
+        Only the first load blocks. Once a snapshot exists, a stale one is
+        refreshed in the background while every caller keeps reading the
+        previous snapshot.
+        """
+        if self._dataset is None:
+            with self._lock:
+                if self._dataset is None:
+                    self._dataset = self._load_initial()
+                return self._dataset
+
+        if (self.source == 'database' and self.is_stale()
+                and self._lock.acquire(blocking=False)):
+            self._refresh_in_background()
+        return self._dataset
+
+
+@st.cache_resource
+def get_store() -> DatasetStore:
+    """Return the process-wide dataset store."""
+    return DatasetStore(shared=get_shared_cache())
+
+
+def load_dataset() -> Dataset:
+    """Return the shared dataset, loading it if needed."""
+    return get_store().get()
+
+
+def get_dataset() -> Dataset | None:
+    """Return the shared dataset if it has already been loaded."""
+    store = get_store()
+    if store.dataset is None:
+        return None
+    return store.get()
@@ -0,0 +1,186 @@
+"""Query engines behind the filtered data and the filtered cube.
+
+``EMVIEW_ENGINE`` selects the implementation used by
+``utils.filters.get_filtered_data`` and ``get_filtered_cube``, on which
+every view aggregation is built:
+
+- ``pandas`` (default): the in-memory dataset, through its filter index and
+  precomputed cube,
+- ``duckdb``: SQL over a Parquet copy of the dataset written once per
+  dataset version (in ``EMVIEW_PARQUET_DIR``), scanned by DuckDB on every
+  core and spilled to disk when it does not fit its memory limit. Needs
+  the ``duckdb`` package.
+
+Both engines return the same frames, with the dataset's dtypes and row
+labels: ``python -m benchmarks.parity`` checks it.
+"""
+import glob
+import logging
+import os
+import threading
+
+import pandas as pd
+import pyarrow.parquet as pq
+import streamlit as st
+
+from utils.cube import DIMENSIONS, IMPACTS, build_cube, filter_cube
+from utils.dataset import Dataset
+from utils.snapshot import snapshot_table
+
+logger = logging.getLogger(__name__)
+
+# "pandas" or "duckdb"
+ENGINE = os.getenv("EMVIEW_ENGINE", "pandas")
+
+# Directory of the Parquet copies read by the DuckDB engine
+PARQUET_DIR = os.getenv("EMVIEW_PARQUET_DIR", "data/parquet")
+
+
+class PandasEngine:
+    """Filter the in-memory dataset."""
+
+    name = 'pandas'
+
+    def filtered_data(self, dataset: Dataset, filters: dict) -> pd.DataFrame:
+        """Apply the sidebar filters to the shared dataset using its index.
+
+        The matching rows are resolved from ``dataset.index`` without
+        scanning the frame, which is then sliced once, and not at all when
+        every row matches.
+        """
+        rows = dataset.index.lookup(filters)
+        if rows is None:
+            return dataset.data
+        return dataset.data.take(rows)
+
+    def filtered_cube(self, dataset: Dataset, filters: dict) -> pd.DataFrame:
+        """Slice the dataset's cube, or rebuild it when filtering on a key.
+
+        Neither the classification key nor event dates are cube dimensions,
+        so the cube is built from the filtered rows when filtering on a key
+        or an "active during" period.
+        """
+        if filters['classification_key'] or filters.get('period'):
+            return build_cube(self.filtered_data(dataset, filters))
+        return filter_cube(dataset.cube, filters)
+
+
+def where_clause(filters: dict, columns) -> tuple[str, list]:
+    """Return the SQL condition of the sidebar filters and its parameters.
+
+    Same semantics as the in-memory filters, for a table of ``columns``;
+    values are bound parameters.
+    """
+    if filters.get('period'):
+        # Event days as in ``utils.index.event_days``
+        start = 'make_date(start_year, 1, 1)'
+        end = 'make_date(end_year, 12, 31)'
+        if 'start_date' in columns:
+            start = f'coalesce(start_date::DATE, {start})'
+        if 'end_date' in columns:
+            end = f'coalesce(end_date::DATE, {end})'
+        # greatest() skips NULLs: an unknown end must not become the start
+        conditions = [
+            f'{start} <= ?::DATE',
+            f'{end} IS NOT NULL',
+            f'greatest({end}, {start}) >= ?::DATE'
+        ]
+        params = [filters['period'][1], filters['period'][0]]
+    else:
+        conditions = ['start_year >= ?', 'end_year <= ?']
+        params = [filters['start'], filters['end']]
+    if filters['classification_key']:
+        conditions.append('regexp_matches(classification_key, ?)')
+        params.append(filters['classification_key'].replace('*', '.*'))
+    for name in ('region', 'subregion', 'country'):
+        if filters.get(name):
+            conditions.append(f'{name} = ?')
+            params.append(filters[name])
+    return ' AND '.join(conditions), params
+
+
+def cube_select() -> str:
+    """Return the measures of the cube, mirroring ``utils.cube.build_cube``."""
+    measures = [
+        'count(*) AS rows',
+        'count(disno) AS count',
+        'count(DISTINCT disno) AS disno'
+    ]
+    for name, col in IMPACTS.items():
+        measures.append(f'coalesce(sum({col}), 0) AS {name}')
+        measures.append(f'count({col}) AS {name}_reported')
+    return f"{', '.join(DIMENSIONS)}, {', '.join(measures)}"
+
+
+class DuckDBEngine:
+    """Filter and aggregate a Parquet copy of the dataset with DuckDB."""
+
+    name = 'duckdb'
+
+    def __init__(self, directory: str = PARQUET_DIR):
+        import duckdb
+
+        self.directory = directory
+        self._connection = duckdb.connect()
+        self._lock = threading.Lock()
+
+    def parquet_path(self, dataset: Dataset) -> str:
+        """Return the Parquet copy of ``dataset``, writing it on first use.
+
+        Copies of previous versions are removed once the new one is in place.
+        """
+        path = os.path.join(self.directory, f'emdata_hist-{dataset.version}.parquet')
+        if os.path.isfile(path):
+            return path
+        with self._lock:
+            if not os.path.isfile(path):
+                os.makedirs(self.directory, exist_ok=True)
+                tmp_path = f'{path}.tmp'
+                pq.write_table(snapshot_table(dataset.data), tmp_path, row_group_size=100_000)
+                os.replace(tmp_path, path)
+                for previous in glob.glob(os.path.join(self.directory, 'emdata_hist-*.parquet')):
+                    if previous != path:
+                        os.remove(previous)
+        return path
+
+    def query(self, sql: str, params: list) -> pd.DataFrame:
+        # A cursor is a connection of its own, safe to use from this thread
+        with self._connection.cursor() as cursor:
+            return cursor.execute(sql, params).df()
+
+    def filtered_data(self, dataset: Dataset, filters: dict) -> pd.DataFrame:
+        """Return the matching rows with the dataset's dtypes and row labels."""
+        where, params = where_clause(filters, dataset.data.columns)
+        data = self.query(
+            f"SELECT * FROM read_parquet(?, file_row_number = true) "
+            f"WHERE {where} ORDER BY file_row_number",
+            [self.parquet_path(dataset), *params]
+        )
+        data = data.set_index('file_row_number').rename_axis(None)
+        return data.astype(dataset.data.dtypes.to_dict())
+
+    def filtered_cube(self, dataset: Dataset, filters: dict) -> pd.DataFrame:
+        """Return the cube of the matching rows with the dataset cube's dtypes."""
+        where, params = where_clause(filters, dataset.data.columns)
+        cube = self.query(
+            f"SELECT {cube_select()} FROM read_parquet(?) "
+            f"WHERE {where} GROUP BY ALL",
+            [self.parquet_path(dataset), *params]
+        )
+        return cube.astype(dataset.cube.dtypes.to_dict())
+
+
+ENGINES = {
+    'pandas': PandasEngine,
+    'duckdb': DuckDBEngine
+}
+
+
+@st.cache_resource(show_spinner=False)
+def get_engine(name: str = ENGINE):
+    """Return the configured engine, or the pandas one if it is unavailable."""
+    try:
+        return ENGINES[name]()
+    except (KeyError, ImportError):
+        logger.warning("Query engine %r unavailable, using pandas", name, exc_info=True)
+        return PandasEngine()
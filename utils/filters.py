@@ -1,5 +1,24 @@
+import logging
+import time
+from datetime import date
+
 import pandas as pd
 import streamlit as st
+from sqlalchemy.exc import SQLAlchemyError
+
+from utils.cache import get_result_cache
+from utils.database import (
+    AGGREGATES, KEY_COLUMN, estimate_selectivity, get_aggregate_cube,
+    get_aggregates_version, get_column_data, get_filter_summary,
+    get_table_columns
+)
+from utils.dataset import DATA_SOURCE, DATA_TTL, Dataset, get_dataset, load_dataset
+from utils.engine import get_engine
+from utils.geo import GeoHierarchy
+from utils.index import date_days, event_days, key_regex
+from utils.metrics import instrumented
+
+logger = logging.getLogger(__name__)
 
 DOC_URI = "https://doc.emdat.be/docs"
 CLASSIF_KEY_DOC_URI = (
@@ -7,12 +26,24 @@ CLASSIF_KEY_DOC_URI = (
     f"#main-classification-tree"
 )
 
+# Largest estimated fraction of the table worth fetching from Postgres
+# instead of loading the full dataset in memory
+PUSHDOWN_MAX_SELECTIVITY = 0.05
+
+# Seconds a selectivity estimate, or a failure to get one, is reused before
+# asking Postgres again
+PLAN_TTL = 60
+
+# Seconds before columns not loaded with the dataset are offered again after
+# fetching one failed
+COLUMN_RETRY = 60
+
 def init_sidebar_filters() -> None:
     """Initialize sidebar filters."""
     ss = st.session_state
 
     # If no data, disable filters
-    filters_disabled = "data" not in ss
+    filters_disabled = get_filter_options() is None
 
     if not filters_disabled:
         if "filter.disabled" not in ss:
@@ -24,21 +55,54 @@ def init_sidebar_filters() -> None:
             label='**Start year**',
             min_value=ss["filter.year_min"],
             max_value=ss["filter.year_max"],
-            key='filter.start'
+            key='filter.start',
+            disabled=ss["filter.overlap"]
         )
 
         col2.number_input(
             label='**End year**',
             min_value=ss["filter.year_min"],
             max_value=ss["filter.year_max"],
-            key='filter.end'
+            key='filter.end',
+            disabled=ss["filter.overlap"]
         )
 
+        st.sidebar.toggle(
+            label="**Active during period**",
+            key="filter.overlap",
+            on_change=process_overlap,
+            help=(
+                "Keep every event active at some point between two dates, "
+                "including those that started before or ended after them. "
+                "Otherwise, keep the events that started and ended within "
+                "the years."
+            )
+        )
+
+        if ss["filter.overlap"]:
+            col1, col2 = st.sidebar.columns(2)
+            col1.date_input(
+                label='**From**',
+                min_value=date(ss["filter.year_min"], 1, 1),
+                max_value=date(ss["filter.year_max"], 12, 31),
+                key='filter.date_from'
+            )
+            col2.date_input(
+                label='**To**',
+                min_value=date(ss["filter.year_min"], 1, 1),
+                max_value=date(ss["filter.year_max"], 12, 31),
+                key='filter.date_to'
+            )
+
         st.sidebar.text_input(
             label="**Classification Key**",
             key="filter.classification_key",
             help="Enter the key or its initial part to filter"
         )
+        if not is_valid_key(ss.get("filter.classification_key", "").strip()):
+            st.sidebar.error(
+                "Invalid classification key pattern, not filtering on it.", icon="🚨"
+            )
         st.sidebar.caption(
             f"_Check classification keys [here]({CLASSIF_KEY_DOC_URI})._"
         )
@@ -76,84 +140,107 @@ def init_sidebar_filters() -> None:
         st.sidebar.divider()
 
 
+def process_overlap() -> None:
+    """Start the "active during" period from the selected years."""
+    ss = st.session_state
+    if ss['filter.overlap']:
+        ss['filter.date_from'] = date(int(ss['filter.start']), 1, 1)
+        ss['filter.date_to'] = date(int(ss['filter.end']), 12, 31)
+
 def process_region() -> None:
     """Update subregion and country options based on selected region."""
     ss = st.session_state
-    rd = ss['region_data']
+    geo, _ = get_filter_options()
     region = ss['filter.region']
-    subregion = ss['filter.subregion']
-    country = ss['filter.country']
-
-    if region:
-        valid_data = rd[rd['region'] == region]
-        if subregion not in valid_data['subregion'].values:
-            ss['filter.subregion'] = None
-        if country not in valid_data['country'].values:
-            ss['filter.country'] = None
-        ss['subregion_list'] = [None] + sorted(valid_data['subregion'].dropna().unique())
-        ss['country_list'] = [None] + sorted(valid_data['country'].dropna().unique())
-    else:
+
+    ss['subregion_list'] = geo.subregions(region)
+    ss['country_list'] = geo.countries(region)
+    if not region or ss['filter.subregion'] not in ss['subregion_list']:
         ss['filter.subregion'] = None
+    if not region or ss['filter.country'] not in ss['country_list']:
         ss['filter.country'] = None
-        ss['subregion_list'] = [None] + sorted(rd['subregion'].dropna().unique())
-        ss['country_list'] = [None] + sorted(rd['country'].dropna().unique())
 
 def process_subregion() -> None:
     """Update region and country options based on selected subregion."""
     ss = st.session_state
-    rd = ss['region_data']
-    region = ss['filter.region']
+    geo, _ = get_filter_options()
     subregion = ss['filter.subregion']
-    country = ss['filter.country']
 
     if subregion:
-        valid_data = rd[rd['subregion'] == subregion]
-        if region not in valid_data['region'].values:
-            ss['filter.region'] = valid_data.iloc[0]['region']
-        if country not in valid_data['country'].values:
-            ss['filter.country'] = None
-        ss['country_list'] = [None] + sorted(valid_data['country'].dropna().unique())
-    else:
+        ss['filter.region'] = geo.region_of(subregion)
+    ss['country_list'] = geo.countries(ss['filter.region'], subregion)
+    if not subregion or ss['filter.country'] not in ss['country_list']:
         ss['filter.country'] = None
-        if region:
-            valid_data = rd[rd['region'] == region]
-            ss['country_list'] = [None] + sorted(valid_data['country'].dropna().unique())
-        else:
-            ss['country_list'] = [None] + sorted(rd['country'].dropna().unique())
 
 def process_country() -> None:
     """Update region and subregion based on selected country."""
     ss = st.session_state
-    rd = ss['region_data']
-    country = ss['filter.country']
+    geo, _ = get_filter_options()
+    place = geo.place(ss['filter.country'])
 
-    if country:
-        valid_data = rd[rd['country'] == country]
-        if not valid_data.empty:
-            ss['filter.region'] = valid_data.iloc[0]['region']
-            ss['filter.subregion'] = valid_data.iloc[0]['subregion']
+    if place is not None:
+        ss['filter.region'], ss['filter.subregion'], _ = place
 
-def get_filtered_data() -> pd.DataFrame:
-    """Return a filtered view of the data based on current filters."""
+def get_filter_state() -> dict:
+    """Return the current sidebar filters in normalized form."""
     ss = st.session_state
 
-    # Get current filters
-    start = ss["filter.start"]
-    end = ss["filter.end"]
-    classification_key = ss["filter.classification_key"].strip()
-    region = ss["filter.region"]
-    subregion = ss["filter.subregion"]
-    country = ss["filter.country"]
+    # Pages run before the sidebar: a deep link may need the defaults first
+    if "filter.disabled" not in ss:
+        set_filters_to_default()
+
+    # Days of the "active during" period, if set, as ISO dates
+    period = None
+    if ss.get("filter.overlap") and ss.get("filter.date_from") and ss.get("filter.date_to"):
+        period = (ss["filter.date_from"].isoformat(), ss["filter.date_to"].isoformat())
 
-    # Filter data
-    data_filtered = ss['data'].copy()
+    # A key that is not a valid pattern is ignored; the sidebar tells so
+    classification_key = ss.get("filter.classification_key", "").strip()
+    if not is_valid_key(classification_key):
+        classification_key = ''
 
-    # Year filter
-    data_filtered = data_filtered[
-        (data_filtered['start_year'] >= start) & (data_filtered['end_year'] <= end)
-    ]
+    return {
+        'start': int(ss["filter.start"]),
+        'end': int(ss["filter.end"]),
+        'classification_key': classification_key,
+        'region': ss["filter.region"],
+        'subregion': ss["filter.subregion"],
+        'country': ss["filter.country"],
+        'period': period
+    }
+
+def is_valid_key(key: str) -> bool:
+    """Tell whether a classification key pattern can be matched."""
+    try:
+        key_regex(key)
+    except ValueError:
+        return False
+    return True
+
+def filter_data(data: pd.DataFrame, filters: dict) -> pd.DataFrame:
+    """Apply the sidebar filters to an in-memory frame.
+
+    Scans every row: the app filters through the dataset's index instead
+    (see ``utils.engine``). Kept as the reference semantics the engines are
+    checked against by ``python -m benchmarks.parity``.
+    """
+    # No copy needed: the shared frame is copy-on-write, so the masks below
+    # never touch its buffers.
+    data_filtered = data
+
+    # Year filter, or events active at any time during the period
+    if filters.get('period'):
+        start, end = event_days(data_filtered)
+        first, last = (date_days(day) for day in filters['period'])
+        data_filtered = data_filtered[(start <= last) & (end >= first)]
+    else:
+        data_filtered = data_filtered[
+            (data_filtered['start_year'] >= filters['start'])
+            & (data_filtered['end_year'] <= filters['end'])
+        ]
 
     # Classification key filter (wildcard matching)
+    classification_key = filters['classification_key']
     if classification_key:
         data_filtered = data_filtered[
             data_filtered['classification_key'].str.contains(
@@ -162,33 +249,217 @@ def get_filtered_data() -> pd.DataFrame:
         ]
 
     # Region/Subregion/Country filters
-    if region:
-        data_filtered = data_filtered[data_filtered['region'] == region]
-    if subregion:
-        data_filtered = data_filtered[data_filtered['subregion'] == subregion]
-    if country:
-        data_filtered = data_filtered[data_filtered['country'] == country]
+    if filters['region']:
+        data_filtered = data_filtered[data_filtered['region'] == filters['region']]
+    if filters['subregion']:
+        data_filtered = data_filtered[data_filtered['subregion'] == filters['subregion']]
+    if filters['country']:
+        data_filtered = data_filtered[data_filtered['country'] == filters['country']]
 
     return data_filtered
 
+def plan_filtered_query(filters: dict) -> str:
+    """
+    Parameters
+    ----------
+    filters : dict
+        Normalized filter state, see ``get_filter_state``.
+
+    Returns
+    -------
+    str
+        ``'memory'`` to filter the shared in-memory dataset or ``'database'``
+        to push the filters down to Postgres. Memory always wins once the
+        dataset is loaded; before that, only queries the Postgres planner
+        expects to be narrow are pushed down, anything wider is better
+        served by waiting for the full dataset every session can then share.
+    """
+    if get_dataset() is not None or DATA_SOURCE != 'database':
+        return 'memory'
+    selectivity = get_selectivity(filter_key(filters))
+    if selectivity is not None and selectivity <= PUSHDOWN_MAX_SELECTIVITY:
+        return 'database'
+    return 'memory'
+
+@st.cache_data(ttl=PLAN_TTL, show_spinner=False)
+def get_selectivity(key: tuple) -> float | None:
+    """Return the estimated selectivity of the filters with ``key``.
+
+    None when Postgres could not estimate it, a timeout included. Either
+    result is kept for :data:`PLAN_TTL` seconds, so that reruns while the
+    dataset loads do not each query or wait on the database.
+    """
+    filters = dict(key)
+    try:
+        return estimate_selectivity(filters)
+    except SQLAlchemyError:
+        logger.warning("Could not estimate the selectivity of %s", filters, exc_info=True)
+        return None
+
+def filter_key(filters: dict) -> tuple:
+    """Return a hashable, order-independent key for a filter state."""
+    return tuple(sorted(filters.items()))
+
+@instrumented('filter.data')
+def get_filtered_data(filters: dict = None) -> pd.DataFrame:
+    """Return a filtered view of the data based on current filters.
+
+    Results are computed by the configured engine (see ``utils.engine``)
+    and shared between sessions through the process-wide result cache,
+    keyed on the dataset version and the normalized filters.
+    """
+    if filters is None:
+        filters = get_filter_state()
+
+    dataset = load_dataset()
+    cache = get_result_cache()
+    key = ('filtered', dataset.version, filter_key(filters))
+    data = cache.get(key)
+    if data is None:
+        data = get_engine().filtered_data(dataset, filters)
+        # The unfiltered dataset costs the cache nothing
+        cache.put(key, data, size=0 if data is dataset.data else None)
+    return data
+
+def uses_database_aggregates(filters: dict) -> bool:
+    """Tell whether the cube for ``filters`` is read from Postgres."""
+    return (
+        AGGREGATES == 'database'
+        and not filters['classification_key']
+        and not filters.get('period')
+    )
+
+@instrumented('filter.cube')
+def get_filtered_cube(filters: dict = None) -> pd.DataFrame:
+    """Return the aggregate cube (see ``utils.cube``) for the current filters.
+
+    Computed by the configured engine (see ``utils.engine``) and shared
+    through the result cache. With ``EMVIEW_AGGREGATES=database`` the cube
+    is read from the Postgres materialized view instead.
+    """
+    if filters is None:
+        filters = get_filter_state()
+
+    if uses_database_aggregates(filters):
+        return get_aggregate_cube(filters, get_aggregates_version())
+
+    dataset = load_dataset()
+    key = ('cube', dataset.version, filter_key(filters))
+    return get_result_cache().get_or_compute(
+        key, lambda: get_engine().filtered_cube(dataset, filters)
+    )
+
+def get_column(dataset: Dataset, name: str) -> pd.Series:
+    """Return a column not loaded with the dataset, indexed by row key.
+
+    Fetched from Postgres on first use and kept in the result cache for
+    the dataset's version.
+    """
+    def compute():
+        column = get_column_data(name)
+        return column[~column.index.duplicated()]
+
+    cache = get_result_cache()
+    key = ('column', dataset.version, name)
+    try:
+        return cache.get_or_compute(key, compute)
+    except SQLAlchemyError:
+        # Remembered so that reruns do not each wait on the database
+        cache.put(('column_failed', dataset.version), time.time(), size=0)
+        raise
+
+def get_columns(dataset: Dataset | None) -> list:
+    """Return the columns that can be shown, see :func:`with_columns`.
+
+    Every column of the table when reading from the database; only the
+    loaded ones without a database, or for :data:`COLUMN_RETRY` seconds
+    after fetching one failed. Before the dataset is loaded (``dataset`` is
+    None), the table's columns as queried from Postgres.
+    """
+    if dataset is None:
+        return get_preload_columns()
+    failed = get_result_cache().get(('column_failed', dataset.version))
+    if DATA_SOURCE != 'database' or (failed and time.time() - failed < COLUMN_RETRY):
+        return list(dataset.data.columns)
+    return list(dataset.columns)
+
+def with_columns(data: pd.DataFrame, columns: list) -> pd.DataFrame:
+    """Return ``data`` restricted to ``columns``, fetching any not loaded."""
+    missing = [c for c in columns if c not in data.columns]
+    if not missing:
+        return data[columns]
+
+    dataset = load_dataset()
+    extra = {
+        name: data[KEY_COLUMN].map(get_column(dataset, name))
+        for name in missing
+    }
+    return data.assign(**extra)[columns]
+
+def default_filters(dataset: Dataset) -> dict:
+    """Return the filter state covering the full dataset."""
+    data = dataset.data
+    return year_filters(int(data['start_year'].min()), int(data['start_year'].max()))
+
+def year_filters(start: int, end: int) -> dict:
+    """Return the filter state covering the years ``start`` to ``end``."""
+    return {
+        'start': start,
+        'end': end,
+        'classification_key': '',
+        'region': None,
+        'subregion': None,
+        'country': None,
+        'period': None
+    }
+
+@st.cache_resource(ttl=DATA_TTL, show_spinner=False)
+def get_preload_options() -> tuple:
+    """Return the sidebar's geography and defaults from a summary query."""
+    summary = get_filter_summary()
+    defaults = year_filters(
+        int(summary['first_year'].min()), int(summary['last_year'].max())
+    )
+    return GeoHierarchy(summary), defaults
+
+@st.cache_resource(ttl=DATA_TTL, show_spinner=False)
+def get_preload_columns() -> list:
+    """Return the columns of the table before the dataset is loaded."""
+    return get_table_columns()
+
+def get_filter_options() -> tuple | None:
+    """Return the geography and the default filter state of the sidebar.
+
+    From the shared dataset once loaded. Before that, from a summary of the
+    table queried from Postgres, so that the sidebar and narrow queries do
+    not wait for the full load; None if the database cannot tell either.
+    """
+    dataset = get_dataset()
+    if dataset is not None:
+        return dataset.geo, default_filters(dataset)
+    if DATA_SOURCE != 'database':
+        return None
+    try:
+        return get_preload_options()
+    except SQLAlchemyError:
+        logger.warning("Could not query the filter options", exc_info=True)
+        return None
+
 def set_filters_to_default() -> None:
     """Reset filters to default full dataset."""
     ss = st.session_state
-    data = ss["data"]
-    rd = ss['region_data']
+    geo, defaults = get_filter_options()
 
     ss['filter.disabled'] = False
-    year_min = int(data['start_year'].min())
-    year_max = int(data['start_year'].max())
-
-    ss['filter.year_min'] = year_min
-    ss['filter.year_max'] = year_max
-    ss['filter.start'] = year_min
-    ss['filter.end'] = year_max
+    ss['filter.year_min'] = defaults['start']
+    ss['filter.year_max'] = defaults['end']
+    ss['filter.start'] = defaults['start']
+    ss['filter.end'] = defaults['end']
+    ss['filter.overlap'] = False
     ss['filter.region'] = None
     ss['filter.subregion'] = None
     ss['filter.country'] = None
 
-    ss['region_list'] = [None] + sorted(rd['region'].dropna().unique())
-    ss['subregion_list'] = [None] + sorted(rd['subregion'].dropna().unique())
-    ss['country_list'] = [None] + sorted(rd['country'].dropna().unique())
+    ss['region_list'] = geo.regions
+    ss['subregion_list'] = geo.subregions()
+    ss['country_list'] = geo.countries()
@@ -0,0 +1,121 @@
+import logging
+import os
+import re
+
+import pandas as pd
+import plotly
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# Codes of former countries in EM-DAT. plotly.js recognizes some of their
+# names but draws today's borders only, so none of them has a shape.
+HISTORICAL_ISO_CODES = {
+    'ANT',  # Netherlands Antilles
+    'AZO',  # Azores Islands
+    'CSK',  # Czechoslovakia
+    'DDR',  # German Democratic Republic
+    'DFR',  # Germany Federal Republic
+    'EAZ',  # Zanzibar
+    'SCG',  # Serbia Montenegro
+    'SPI',  # Canary Islands
+    'SUN',  # Soviet Union
+    'YMD',  # Yemen P Dem Rep
+    'YMN',  # Yemen Arab Rep
+    'YUG'   # Yugoslavia
+}
+
+
+@st.cache_resource(show_spinner=False)
+def plotly_iso_codes() -> frozenset:
+    """Return the ISO 3166-1 alpha-3 codes known to the bundled plotly.js.
+
+    They are read from its country-name table, which is keyed by code.
+    Empty if the bundle cannot be read, in which case every code not in
+    :data:`HISTORICAL_ISO_CODES` is considered drawable.
+    """
+    path = os.path.join(os.path.dirname(plotly.__file__), 'package_data', 'plotly.min.js')
+    try:
+        with open(path, encoding='utf-8') as file:
+            bundle = file.read()
+    except OSError:
+        logger.warning("Could not read %s to resolve ISO codes", path, exc_info=True)
+        return frozenset()
+    start = bundle.find('{AFG:')
+    end = bundle.find('}', start)
+    if start < 0:
+        return frozenset()
+    return frozenset(re.findall(r'([A-Z]{3}):"', bundle[start:end]))
+
+
+def is_mappable(iso) -> bool:
+    """Tell whether plotly can draw the country with ISO code ``iso``."""
+    if not isinstance(iso, str) or iso in HISTORICAL_ISO_CODES:
+        return False
+    known = plotly_iso_codes()
+    return not known or iso in known
+
+
+def options(values: pd.Series) -> list:
+    """Return the select options for ``values``: None (All), then sorted."""
+    return [None] + sorted(values.dropna().unique())
+
+
+class GeoHierarchy:
+    """Region, subregion and country hierarchy of a dataset.
+
+    Built once per dataset version, with every option list of the cascading
+    sidebar selects sorted up front, so that a select change is a dictionary
+    lookup. The option lists are shared and must not be modified.
+
+    ``places`` has a row per country, indexed by name, with its ``region``,
+    ``subregion``, ``iso`` code and whether plotly can draw it
+    (``mappable``), for the Map view to join on.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        geo = data[['region', 'subregion', 'country', 'iso']]
+
+        self.regions = options(geo['region'])
+        self._subregions = {None: options(geo['subregion'])}
+        self._countries = {None: options(geo['country'])}
+        for region, group in geo.groupby('region', observed=True):
+            self._subregions[region] = options(group['subregion'])
+            self._countries[region] = options(group['country'])
+        self._subregion_countries = {}
+        self._region_of = {}
+        for subregion, group in geo.groupby('subregion', observed=True):
+            self._subregion_countries[subregion] = options(group['country'])
+            self._region_of[subregion] = group['region'].iloc[0]
+
+        # A country belongs to a single region and subregion in EM-DAT; the
+        # first one seen is kept otherwise
+        places = geo.dropna(subset=['country']).drop_duplicates('country')
+        places = places.astype(object).where(places.notna(), None)
+        self.places = places.set_index('country').sort_index()
+        self.places['mappable'] = self.places['iso'].map(is_mappable).astype(bool)
+        self._place = {
+            country: (region, subregion, iso)
+            for country, region, subregion, iso in zip(
+                self.places.index, self.places['region'],
+                self.places['subregion'], self.places['iso']
+            )
+        }
+
+    def subregions(self, region: str = None) -> list:
+        """Return the subregion options within ``region``, all by default."""
+        return self._subregions.get(region, [None])
+
+    def countries(self, region: str = None, subregion: str = None) -> list:
+        """Return the country options within ``subregion``, else ``region``."""
+        if subregion:
+            return self._subregion_countries.get(subregion, [None])
+        return self._countries.get(region, [None])
+
+    def region_of(self, subregion: str) -> str | None:
+        """Return the region containing ``subregion``."""
+        return self._region_of.get(subregion)
+
+    def place(self, country: str) -> tuple | None:
+        """Return the ``(region, subregion, iso)`` of ``country``, if known."""
+        return self._place.get(country)
@@ -0,0 +1,318 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Geographic columns indexed with per-value row-id lists
+GEO_COLUMNS = ['region', 'subregion', 'country']
+
+EMPTY_ROWS = np.empty(0, dtype=np.intp)
+
+# Resolved classification key patterns kept per index
+MAX_CACHED_PATTERNS = 256
+
+# Fraction of the rows above which year bounds are resolved with a mask over
+# every row: gathering and sorting that many candidates costs more
+YEAR_MASK_FRACTION = 0.15
+
+# Quantile of the event lengths above which IntervalIndex checks events one
+# by one rather than widening its search window to cover them
+LONG_INTERVAL_QUANTILE = 0.99
+
+
+def year_days(years: np.ndarray, last: bool = False) -> np.ndarray:
+    """Return the day number (days since 1970-01-01) of January 1st of
+    each year, or of December 31st if ``last``; NaN for missing years."""
+    days = np.full(len(years), np.nan)
+    known = ~np.isnan(years)
+    first = (years[known].astype(np.int64) - 1970 + last).astype('datetime64[Y]')
+    days[known] = first.astype('datetime64[D]').astype(np.int64) - last
+    return days
+
+
+def key_regex(pattern: str) -> re.Pattern:
+    """Compile a classification key pattern, in which ``*`` is a wildcard.
+
+    Raises
+    ------
+    ValueError
+        If ``pattern`` is not a valid regular expression.
+    """
+    try:
+        return re.compile(pattern.replace('*', '.*'))
+    except re.error as e:
+        raise ValueError(f"invalid pattern {pattern!r}: {e}") from None
+
+
+def date_days(dates) -> float:
+    """Return the day number of an ISO date string or date."""
+    return float(np.datetime64(dates, 'D').astype(np.int64))
+
+
+def event_days(data: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Parameters
+    ----------
+    data : pd.DataFrame
+        EM-DAT events with ``start_year`` and ``end_year`` and, if loaded,
+        ``start_date`` and ``end_date``.
+
+    Returns
+    -------
+    tuple
+        ``(start, end)``: the first and last day number of each event,
+        from its dates. A missing start (end) date falls back to the first
+        (last) day of the start (end) year. An end before the start is
+        moved to the start. Both are NaN if either is unknown.
+    """
+    start = year_days(data['start_year'].to_numpy(dtype=float, na_value=np.nan))
+    end = year_days(data['end_year'].to_numpy(dtype=float, na_value=np.nan), last=True)
+    for days, name in ((start, 'start_date'), (end, 'end_date')):
+        if name in data.columns:
+            dates = data[name].to_numpy(dtype='datetime64[D]')
+            known = ~np.isnat(dates)
+            days[known] = dates[known].astype(np.int64)
+    unknown = np.isnan(start) | np.isnan(end)
+    end = np.maximum(end, start)
+    start[unknown] = end[unknown] = np.nan
+    return start, end
+
+
+class IntervalIndex:
+    """Sorted-endpoint index over event intervals, in day numbers.
+
+    Answers "active at any point in ``[lo, hi]``", i.e. ``start <= hi`` and
+    ``end >= lo``. Intervals longer than ``span``, the
+    :data:`LONG_INTERVAL_QUANTILE` of the lengths, are kept aside in
+    ``long_rows`` and checked one by one. The others are listed by visiting
+    the candidates in a window of the start-sorted array, ``[lo - span,
+    hi]``, or of the end-sorted one, ``[lo, hi + span]``, whichever is
+    smaller, so a few multi-decade events do not widen every lookup.
+
+    A lookup costs four binary searches, the smaller window and the long
+    intervals: at worst, when every interval is within ``span`` of the
+    period, all the rows.
+    """
+
+    def __init__(self, start: np.ndarray, end: np.ndarray):
+        self.start = start
+        self.end = end
+        lengths = end - start
+        finite = np.isfinite(lengths)
+        self.span = np.quantile(lengths[finite], LONG_INTERVAL_QUANTILE) if finite.any() else 0.0
+        # NaN lengths compare False: such intervals never satisfy a bound
+        # and NaN sorts last, so they stay in the sorted arrays
+        long = lengths > self.span
+        self.long_rows = np.flatnonzero(long)
+        rows = np.flatnonzero(~long)
+        self.start_order = rows[np.argsort(start[rows], kind='stable')]
+        self.start_sorted = start[self.start_order]
+        self.end_order = rows[np.argsort(end[rows], kind='stable')]
+        self.end_sorted = end[self.end_order]
+
+    def overlapping(self, lo: float, hi: float) -> np.ndarray:
+        """Return the sorted row ids of the intervals overlapping ``[lo, hi]``."""
+        start_lo = np.searchsorted(self.start_sorted, lo - self.span, side='left')
+        start_hi = np.searchsorted(self.start_sorted, hi, side='right')
+        end_lo = np.searchsorted(self.end_sorted, lo, side='left')
+        end_hi = np.searchsorted(self.end_sorted, hi + self.span, side='right')
+        if start_hi - start_lo <= end_hi - end_lo:
+            rows = self.start_order[start_lo:start_hi]
+            rows = rows[self.end[rows] >= lo]
+        else:
+            rows = self.end_order[end_lo:end_hi]
+            rows = rows[self.start[rows] <= hi]
+        return np.sort(np.concatenate([rows, self.contains(self.long_rows, lo, hi)]))
+
+    def contains(self, rows: np.ndarray, lo: float, hi: float) -> np.ndarray:
+        """Return the ``rows`` whose interval overlaps ``[lo, hi]``."""
+        return rows[(self.start[rows] <= hi) & (self.end[rows] >= lo)]
+
+
+def build_postings(values: pd.Series) -> tuple:
+    """
+    Parameters
+    ----------
+    values : pd.Series
+        Column to index.
+
+    Returns
+    -------
+    tuple
+        ``(codes, postings)`` where ``codes`` gives each row's integer value
+        code (-1 for missing) and ``postings`` maps each distinct value to the
+        sorted array of row ids holding it. All posting arrays are views of a
+        single permutation array.
+    """
+    codes, uniques = pd.factorize(values)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    postings = {
+        value: order[bounds[i]:bounds[i + 1]]
+        for i, value in enumerate(uniques)
+    }
+    return codes, postings
+
+
+class KeyIndex:
+    """Inverted index over the distinct classification keys.
+
+    A key pattern is matched once against the few hundred distinct keys
+    rather than against every row, and the rows are then selected by integer
+    key code. Patterns keep the sidebar semantics: ``*`` is a wildcard and
+    the pattern may match anywhere in the key (``nat-geo``, ``nat-*-flo``,
+    ``flo-riv``).
+    """
+
+    def __init__(self, values: pd.Series):
+        self.codes, self.postings = build_postings(values)
+        self.keys = list(self.postings)
+        self._patterns = {}
+
+    def resolve(self, pattern: str) -> np.ndarray:
+        """Return the codes of the distinct keys matching ``pattern``.
+
+        Raises ValueError if ``pattern`` is not valid, see :func:`key_regex`.
+        """
+        codes = self._patterns.get(pattern)
+        if codes is None:
+            regex = key_regex(pattern)
+            codes = np.array([
+                code for code, key in enumerate(self.keys)
+                if isinstance(key, str) and regex.search(key)
+            ], dtype=self.codes.dtype)
+            if len(self._patterns) >= MAX_CACHED_PATTERNS:
+                self._patterns.clear()
+            self._patterns[pattern] = codes
+        return codes
+
+    def lookup(self, pattern: str, rows: np.ndarray | None = None) -> np.ndarray:
+        """
+        Parameters
+        ----------
+        pattern : str
+            Classification key pattern as typed in the sidebar.
+        rows : np.ndarray, optional
+            Sorted candidate row ids. All rows are candidates by default.
+
+        Returns
+        -------
+        np.ndarray
+            Sorted ids of the candidate rows whose key matches ``pattern``.
+        """
+        codes = self.resolve(pattern)
+        if rows is None:
+            if len(codes) == 0:
+                return EMPTY_ROWS
+            return np.sort(np.concatenate([self.postings[self.keys[c]] for c in codes]))
+        return rows[np.isin(self.codes[rows], codes)]
+
+
+class FilterIndex:
+    """Row-id index answering the sidebar filters without scanning the frame.
+
+    Built once per dataset version. Geographic filters are resolved from
+    per-value posting lists and year bounds from sorted start/end arrays;
+    the most selective of these gives the candidate rows and the remaining
+    conditions are checked on the candidates only. An "active during" period
+    replaces the year bounds and is resolved through an
+    :class:`IntervalIndex` over the event dates. The classification key is
+    resolved last through a :class:`KeyIndex`.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self.size = len(data)
+        self.codes = {}
+        self.postings = {}
+        for name in GEO_COLUMNS:
+            self.codes[name], self.postings[name] = build_postings(data[name])
+        self.classification = KeyIndex(data['classification_key'])
+
+        self.start_year = data['start_year'].to_numpy(dtype=float, na_value=np.nan)
+        self.end_year = data['end_year'].to_numpy(dtype=float, na_value=np.nan)
+        # NaN years sort last and never satisfy a bound, as in pandas
+        self.start_order = np.argsort(self.start_year, kind='stable')
+        self.start_sorted = self.start_year[self.start_order]
+        self.end_order = np.argsort(self.end_year, kind='stable')
+        self.end_sorted = self.end_year[self.end_order]
+        # Bounds every row is within, if every row has both years (NaN last)
+        complete = self.size and not (
+            np.isnan(self.start_sorted[-1]) or np.isnan(self.end_sorted[-1])
+        )
+        self.year_span = (self.start_sorted[0], self.end_sorted[-1]) if complete else None
+        self.period = IntervalIndex(*event_days(data))
+
+    def _year_rows(self, start, end) -> np.ndarray | None:
+        """Sorted ids of the rows within the year bounds, None if all are.
+
+        Candidates come from the smaller of the two year ranges, or from a
+        mask over every row when both are wide.
+        """
+        if self.year_span is not None and start <= self.year_span[0] and end >= self.year_span[1]:
+            return None
+        lo = np.searchsorted(self.start_sorted, start, side='left')
+        hi = np.searchsorted(self.start_sorted, np.inf, side='right')
+        n_start = hi - lo
+        n_end = np.searchsorted(self.end_sorted, end, side='right')
+
+        if min(n_start, n_end) > self.size * YEAR_MASK_FRACTION:
+            return np.flatnonzero((self.start_year >= start) & (self.end_year <= end))
+        if n_start <= n_end:
+            rows = self.start_order[lo:hi]
+            rows = rows[self.end_year[rows] <= end]
+        else:
+            rows = self.end_order[:n_end]
+            rows = rows[self.start_year[rows] >= start]
+        return np.sort(rows)
+
+    def lookup(self, filters: dict) -> np.ndarray | None:
+        """
+        Parameters
+        ----------
+        filters : dict
+            Normalized filter state, see ``utils.filters.get_filter_state``.
+
+        Returns
+        -------
+        np.ndarray or None
+            Sorted ids of the matching rows, or None if every row matches.
+        """
+        geo = [
+            (name, filters[name]) for name in GEO_COLUMNS if filters.get(name)
+        ]
+        period = filters.get('period')
+        if period:
+            period = tuple(date_days(day) for day in period)
+        if geo:
+            # Start from the shortest posting list, check the others by code
+            geo.sort(key=lambda item: len(self.get_rows(*item)))
+            rows = self.get_rows(*geo[0])
+            for name, value in geo[1:]:
+                rows = rows[self.codes[name][rows] == self.get_code(name, value)]
+            if period:
+                rows = self.period.contains(rows, *period)
+            else:
+                rows = rows[
+                    (self.start_year[rows] >= filters['start'])
+                    & (self.end_year[rows] <= filters['end'])
+                ]
+        elif period:
+            rows = self.period.overlapping(*period)
+        else:
+            rows = self._year_rows(filters['start'], filters['end'])
+
+        if filters.get('classification_key'):
+            rows = self.classification.lookup(filters['classification_key'], rows)
+
+        if rows is None or len(rows) == self.size:
+            return None
+        return rows
+
+    def get_rows(self, name: str, value) -> np.ndarray:
+        """Return the sorted ids of the rows where ``name == value``."""
+        return self.postings[name].get(value, EMPTY_ROWS)
+
+    def get_code(self, name: str, value) -> int:
+        """Return the integer code of ``value`` in ``name`` (-2 if absent)."""
+        rows = self.get_rows(name, value)
+        return self.codes[name][rows[0]] if len(rows) else -2
@@ -67,6 +67,11 @@ PAGE_HELP_TEXT = {
     display. For a complete description of the column variables, we refer to
     the [EM-DAT Public Table](https://doc.emdat.be/docs/data-structure-and-content/emdat-public-table/) 
     documentation.
+
+    **Sorting and Paging**
+
+    Rows are shown one page at a time. Users may sort them on any column and 
+    choose the number of rows per page and the page to display.
     """,
     "map": """
     The Map View page makes it possible to build maps at the country level 
@@ -167,7 +172,7 @@ def format_num(num):
     """
     try:
         return f"{int(num):,}"
-    except ValueError:
+    except (TypeError, ValueError):
         return None
 
 
@@ -0,0 +1,100 @@
+"""Postgres materialized views holding the dashboard aggregates.
+
+Run after each load of ``public.emdata_hist``::
+
+    python -m utils.matviews create    # once, creates the views and indexes
+    python -m utils.matviews refresh   # after every data load
+
+Set ``EMVIEW_AGGREGATES=database`` to have the chart pages read these views
+instead of aggregating in the Streamlit process: the cube of ``utils.cube``
+and its yearly rollups by disaster type (Metric and Time views) and by
+country (Map view), each stage reading the narrowest view it can filter.
+"""
+import argparse
+
+from sqlalchemy import text
+
+from utils.cube import IMPACTS
+from utils.database import AGGREGATE_VIEWS, REFRESH_TABLE, engine
+
+
+def cube_view_sql(dimensions: list) -> str:
+    """Return the SELECT of a view of the cube rolled up on ``dimensions``.
+
+    Mirrors ``utils.cube.build_cube``, which it matches for the cube's own
+    dimensions.
+    """
+    measures = [
+        "count(*) AS rows",
+        "count(disno) AS count",
+        "count(DISTINCT disno) AS disno"
+    ]
+    for name, col in IMPACTS.items():
+        measures.append(f"coalesce(sum({col}), 0)::double precision AS {name}")
+        measures.append(f"count({col}) AS {name}_reported")
+    dims = ", ".join(dimensions)
+    return (
+        f"SELECT {dims}, {', '.join(measures)} "
+        f"FROM public.emdata_hist GROUP BY {dims}"
+    )
+
+
+# Name -> (SELECT, unique key). REFRESH ... CONCURRENTLY needs a unique
+# index; cube dimensions may be NULL, hence NULLS NOT DISTINCT (Postgres 15+).
+MATERIALIZED_VIEWS = {
+    f"public.{name}": (cube_view_sql(dimensions), dimensions)
+    for name, dimensions in AGGREGATE_VIEWS.items()
+}
+
+
+def create_materialized_views() -> None:
+    """Create the views, their unique indexes and the refresh record if missing."""
+    with engine.begin() as conn:
+        # Building a view scans the whole table: no statement timeout
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        for name, (query, key) in MATERIALIZED_VIEWS.items():
+            index = name.split('.')[-1] + "_key"
+            conn.execute(text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS {query}"))
+            conn.execute(text(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {index} "
+                f"ON {name} ({', '.join(key)}) NULLS NOT DISTINCT"
+            ))
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {REFRESH_TABLE} (refreshed_at timestamptz NOT NULL)"
+        ))
+        conn.execute(text(
+            f"INSERT INTO {REFRESH_TABLE} SELECT clock_timestamp() "
+            f"WHERE NOT EXISTS (SELECT FROM {REFRESH_TABLE})"
+        ))
+
+
+def refresh_materialized_views() -> None:
+    """Refresh every view without blocking readers of the previous contents."""
+    # CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Nor in a transaction SET LOCAL would apply to: lift the statement
+        # timeout for the session, and restore it before the connection goes
+        # back to the pool
+        conn.execute(text("SET statement_timeout = 0"))
+        try:
+            for name in MATERIALIZED_VIEWS:
+                conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}"))
+            # A new version for the app's caches and the API's ETags
+            conn.execute(text(f"UPDATE {REFRESH_TABLE} SET refreshed_at = clock_timestamp()"))
+        finally:
+            conn.execute(text("RESET statement_timeout"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('action', choices=['create', 'refresh'])
+    args = parser.parse_args()
+
+    if args.action == 'create':
+        create_materialized_views()
+    else:
+        refresh_materialized_views()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Lightweight timing spans on the hot path, exported for Prometheus.
+
+Instrumented stages (loading, filtering, each view's aggregation and
+rendering) record their duration, the number of rows they produced and,
+for rendering, the payload sent to the browser (for charts, only while the
+debug panel is shown or a metrics file is written: measuring it means
+serializing the figure a second time). Totals are kept process-wide and
+served as Prometheus text on the status server's ``/metrics`` route, or
+written to ``EMVIEW_METRICS_FILE`` after each run.
+The spans of the current script run can be shown in a debug panel.
+"""
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from utils.cache import get_result_cache
+
+logger = logging.getLogger(__name__)
+
+# Prometheus text file updated after each script run, e.g. for the
+# node_exporter textfile collector. Disabled if empty.
+METRICS_FILE = os.getenv("EMVIEW_METRICS_FILE", "")
+
+# Show the spans of every run in a sidebar panel ("1"), or only when the
+# page URL has ?debug=1 ("0")
+DEBUG_PANEL = os.getenv("EMVIEW_DEBUG_PANEL", "0") == "1"
+
+# Upper bounds of the duration histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def count_rows(value) -> int | None:
+    """Return the number of rows of a stage's result, if it has any."""
+    if isinstance(value, (pd.DataFrame, pd.Series, pa.Table)):
+        return len(value)
+    if isinstance(value, dict):
+        counts = [count_rows(v) for v in value.values()]
+        counts = [c for c in counts if c is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+class Span:
+    """One timed stage; ``rows`` and ``bytes`` may be set while it runs."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = None
+        self.bytes = None
+        self.seconds = None
+
+
+class Metrics:
+    """Thread-safe, process-wide totals per span name."""
+
+    def __init__(self):
+        self._spans = {}
+        self._lock = threading.Lock()
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            totals = self._spans.setdefault(span.name, {
+                'count': 0,
+                'seconds': 0.0,
+                'buckets': [0] * len(BUCKETS),
+                'rows': 0,
+                'bytes': 0
+            })
+            totals['count'] += 1
+            totals['seconds'] += span.seconds
+            for i, bound in enumerate(BUCKETS):
+                if span.seconds <= bound:
+                    totals['buckets'][i] += 1
+            totals['rows'] += span.rows or 0
+            totals['bytes'] += span.bytes or 0
+
+    def render(self) -> str:
+        """Return the totals in the Prometheus text exposition format."""
+        with self._lock:
+            spans = {name: dict(totals) for name, totals in sorted(self._spans.items())}
+
+        lines = [
+            '# HELP emview_span_seconds Duration of instrumented stages.',
+            '# TYPE emview_span_seconds histogram'
+        ]
+        for name, totals in spans.items():
+            for bound, count in zip(BUCKETS, totals['buckets']):
+                lines.append(f'emview_span_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+            lines.append(f'emview_span_seconds_bucket{{span="{name}",le="+Inf"}} {totals["count"]}')
+            lines.append(f'emview_span_seconds_sum{{span="{name}"}} {totals["seconds"]:.6f}')
+            lines.append(f'emview_span_seconds_count{{span="{name}"}} {totals["count"]}')
+
+        lines += [
+            '# HELP emview_span_rows_total Rows produced by instrumented stages.',
+            '# TYPE emview_span_rows_total counter'
+        ]
+        lines += [f'emview_span_rows_total{{span="{name}"}} {t["rows"]}' for name, t in spans.items()]
+        lines += [
+            '# HELP emview_span_bytes_total Payload bytes sent to the browser.',
+            '# TYPE emview_span_bytes_total counter'
+        ]
+        lines += [
+            f'emview_span_bytes_total{{span="{name}"}} {t["bytes"]}'
+            for name, t in spans.items() if t['bytes']
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+@st.cache_resource(show_spinner=False)
+def get_metrics() -> Metrics:
+    """Return the process-wide metrics."""
+    return Metrics()
+
+
+# Spans of the script run executing in the current thread, if traced
+_local = threading.local()
+
+
+def start_trace() -> None:
+    """Start collecting the spans of the current script run."""
+    _local.trace = []
+
+
+def end_trace() -> list:
+    """Stop collecting and return the spans of the current script run."""
+    trace = getattr(_local, 'trace', None) or []
+    _local.trace = None
+    return trace
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block as stage ``name``."""
+    current = Span(name)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        get_metrics().record(current)
+        trace = getattr(_local, 'trace', None)
+        if trace is not None:
+            trace.append(current)
+
+
+def instrumented(name: str):
+    """Decorate a stage to time it and count the rows it returns."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name) as current:
+                result = func(*args, **kwargs)
+                current.rows = count_rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def debug_panel_enabled() -> bool:
+    """Whether the current run shows the debug panel."""
+    return DEBUG_PANEL or st.query_params.get('debug') == '1'
+
+
+def plotly_chart(fig, **kwargs):
+    """``st.plotly_chart`` timed as ``render.plotly``.
+
+    The payload size is measured only when the debug panel or the metrics
+    file needs it, since it takes serializing the figure once more.
+    """
+    with span('render.plotly') as current:
+        if METRICS_FILE or debug_panel_enabled():
+            current.bytes = len(fig.to_json())
+        return st.plotly_chart(fig, **kwargs)
+
+
+def dataframe(data, **kwargs):
+    """``st.dataframe`` timed as ``render.dataframe``, with its payload size."""
+    with span('render.dataframe') as current:
+        current.rows = count_rows(data)
+        if isinstance(data, pa.Table):
+            current.bytes = data.nbytes
+        elif isinstance(data, pd.DataFrame):
+            current.bytes = int(data.memory_usage(deep=False).sum())
+        return st.dataframe(data, **kwargs)
+
+
+def render_prometheus() -> str:
+    """Return the span totals and result cache counters as Prometheus text."""
+    lines = [
+        '# HELP emview_result_cache Result cache counters and size.',
+        '# TYPE emview_result_cache gauge'
+    ]
+    lines += [
+        f'emview_result_cache{{stat="{name}"}} {value}'
+        for name, value in get_result_cache().stats().items()
+    ]
+    return get_metrics().render() + '\n'.join(lines) + '\n'
+
+
+def write_metrics_file(path: str = METRICS_FILE) -> None:
+    """Write the Prometheus text to ``path``, atomically; no-op if empty."""
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w") as file:
+            file.write(render_prometheus())
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.warning("Could not write the metrics file %s", path, exc_info=True)
+
+
+def show_debug_panel(trace: list) -> None:
+    """Show the spans of the current run in the sidebar, if enabled."""
+    if not debug_panel_enabled():
+        return
+    with st.sidebar.expander("Performance", icon=':material/speed:'):
+        st.dataframe(
+            pd.DataFrame(
+                [(s.name, s.seconds * 1000, s.rows, s.bytes) for s in trace],
+                columns=['span', 'ms', 'rows', 'bytes']
+            ),
+            hide_index=True,
+            use_container_width=True
+        )
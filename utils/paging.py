@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from utils.cache import get_result_cache
+from utils.database import KEY_COLUMN
+from utils.database import get_filtered_data as query_filtered_data
+from utils.dataset import load_dataset
+from utils.filters import filter_key, get_filtered_data, with_columns
+from utils.metrics import instrumented
+
+
+def sort_order(data: pd.DataFrame, column: str | None, ascending: bool) -> np.ndarray:
+    """
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The filtered EM-DAT frame.
+    column : str or None
+        Column to sort on, or None to keep the frame's order.
+    ascending : bool
+        Sort direction. Missing values always come last.
+
+    Returns
+    -------
+    np.ndarray
+        Positions of the rows of ``data`` in display order.
+    """
+    if column is None:
+        return np.arange(len(data))
+    values = pd.Series(data[column].array)
+    return values.sort_values(
+        ascending=ascending, kind='stable', na_position='last'
+    ).index.to_numpy()
+
+
+def get_sort_order(filters: dict, column: str | None, ascending: bool) -> np.ndarray:
+    """Return the display order of the filtered rows, shared through the result cache."""
+    dataset = load_dataset()
+    key = ('order', dataset.version, filter_key(filters), column, ascending)
+
+    def compute():
+        data = get_filtered_data(filters)
+        if column is not None:
+            data = with_columns(data, [column])
+        return sort_order(data, column, ascending)
+
+    return get_result_cache().get_or_compute(key, compute)
+
+
+@instrumented('stage.table_page')
+def get_page(
+        filters: dict,
+        columns: list,
+        sort: str | None = None,
+        ascending: bool = True,
+        page: int = 0,
+        page_size: int = 15) -> pa.Table:
+    """
+    Parameters
+    ----------
+    filters : dict
+        Normalized filter state, see ``utils.filters.get_filter_state``.
+    columns : list
+        Columns to show; those not loaded with the dataset are fetched.
+    sort : str or None, optional
+        Column to sort on, the dataset's order by default.
+    ascending : bool, optional
+        Sort direction.
+    page : int, optional
+        Zero-based page number.
+    page_size : int, optional
+        Number of rows per page.
+
+    Returns
+    -------
+    pa.Table
+        The rows of the requested page, Arrow-encoded so that Streamlit can
+        ship them as is. Pages are cached per filter state, columns and sort,
+        so paging back and forth does no work.
+    """
+    dataset = load_dataset()
+    key = (
+        'page', dataset.version, filter_key(filters), tuple(columns),
+        sort, ascending, page_size, page
+    )
+
+    def compute():
+        data = get_filtered_data(filters)
+        order = get_sort_order(filters, sort, ascending)
+        rows = data.take(order[page * page_size:(page + 1) * page_size])
+        return pa.Table.from_pandas(with_columns(rows, columns), preserve_index=False)
+
+    return get_result_cache().get_or_compute(key, compute)
+
+
+def query_rows(filters: dict, columns: list, sort: str | None = None) -> pd.DataFrame:
+    """Fetch the filtered rows from Postgres with only the columns shown.
+
+    Used before the dataset is loaded, for filters the planner expects to be
+    narrow (see ``utils.filters.plan_filtered_query``).
+    """
+    fetched = list(dict.fromkeys([KEY_COLUMN, *columns, *([sort] if sort else [])]))
+    return query_filtered_data(filters, fetched)
+
+
+@instrumented('stage.table_query_page')
+def get_query_page(
+        filters: dict,
+        columns: list,
+        sort: str | None = None,
+        ascending: bool = True,
+        page: int = 0,
+        page_size: int = 15) -> pa.Table:
+    """Same as :func:`get_page`, for rows pushed down to Postgres."""
+    data = query_rows(filters, columns, sort)
+    order = sort_order(data, sort, ascending)
+    rows = data.take(order[page * page_size:(page + 1) * page_size])
+    return pa.Table.from_pandas(rows[columns], preserve_index=False)
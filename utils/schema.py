@@ -0,0 +1,115 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Low-cardinality text columns stored as categoricals
+CATEGORICAL_COLUMNS = [
+    'historic',
+    'classification_key',
+    'disaster_group',
+    'disaster_subgroup',
+    'disaster_type',
+    'disaster_subtype',
+    'iso',
+    'country',
+    'subregion',
+    'region',
+    'origin',
+    'associated_types',
+    'ofda_bha_response',
+    'appeal',
+    'declaration',
+    'magnitude_scale'
+]
+
+# Nullable integer columns and their storage type
+INTEGER_COLUMNS = {
+    'start_year': 'Int16',
+    'end_year': 'Int16',
+    'start_month': 'Int8',
+    'end_month': 'Int8',
+    'start_day': 'Int8',
+    'end_day': 'Int8',
+    'total_deaths': 'Int32',
+    'no_injured': 'Int32',
+    'no_affected': 'Int32',
+    'no_homeless': 'Int32',
+    'total_affected': 'Int32',
+    'reconstruction_costs_usd_thousands': 'Int64',
+    'reconstruction_costs_adjusted_usd_thousands': 'Int64',
+    'insured_damage_usd_thousands': 'Int64',
+    'insured_damage_adjusted_usd_thousands': 'Int64',
+    'total_damage_usd_thousands': 'Int64',
+    'total_damage_adjusted_usd_thousands': 'Int64'
+}
+
+# Date columns, stored as datetime64 (read as date objects)
+DATE_COLUMNS = ['start_date', 'end_date']
+
+
+def to_integer(values: pd.Series, dtype: str) -> pd.Series:
+    """Cast ``values`` to the nullable integer ``dtype`` if it fits losslessly.
+
+    Values that are fractional or out of the type's range fall back to a
+    nullable float, so the schema never silently corrupts a figure.
+    """
+    if values.dtype == dtype:
+        return values
+    numbers = pd.to_numeric(values, errors='coerce').astype('Float64')
+    info = np.iinfo(dtype.lower())
+    valid = numbers.dropna()
+    if ((valid % 1 != 0).any() or (valid < info.min).any()
+            or (valid > info.max).any()):
+        return numbers
+    return numbers.astype(dtype)
+
+
+def apply_schema(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parameters
+    ----------
+    data : pd.DataFrame
+        EM-DAT frame as read from the database (object strings, float64
+        counts). Columns already in their compact type are left untouched.
+
+    Returns
+    -------
+    pd.DataFrame
+        The same frame with categoricals for low-cardinality text and small
+        nullable integers for years and impact figures. Columns not listed
+        in the schema keep their type.
+    """
+    columns = {}
+    for name in CATEGORICAL_COLUMNS:
+        if name in data.columns and not isinstance(data[name].dtype, pd.CategoricalDtype):
+            columns[name] = data[name].astype('category')
+    for name, dtype in INTEGER_COLUMNS.items():
+        if name in data.columns:
+            columns[name] = to_integer(data[name], dtype)
+    for name in DATE_COLUMNS:
+        if name in data.columns and not pd.api.types.is_datetime64_dtype(data[name]):
+            columns[name] = pd.to_datetime(data[name], errors='coerce')
+    return data.assign(**columns)
+
+
+def memory_footprint(data: pd.DataFrame) -> int:
+    """Return the number of bytes held by ``data``, strings included."""
+    return int(data.memory_usage(index=True, deep=True).sum())
+
+
+def load_with_schema(data: pd.DataFrame) -> pd.DataFrame:
+    """Apply the schema to a freshly read frame, logging the memory saved."""
+    if not logger.isEnabledFor(logging.INFO):
+        return apply_schema(data)
+
+    before = memory_footprint(data)
+    data = apply_schema(data)
+    after = memory_footprint(data)
+    logger.info(
+        "Loaded %d rows: %.1f MB as read, %.1f MB with compact schema",
+        len(data), before / 2 ** 20, after / 2 ** 20
+    )
+    return data
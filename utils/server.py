@@ -0,0 +1,108 @@
+"""Small HTTP server running next to Streamlit for operational endpoints.
+
+Streamlit cannot serve custom routes, so probes are answered from a
+separate port (``EMVIEW_STATUS_PORT``, 8502 by default):
+
+- ``/healthz``: the process is up,
+- ``/ready``: the dataset warm-up has completed (503 until then),
+- ``/metrics``: hot-path timings in the Prometheus text format,
+- ``/api/...``: the views' aggregates as JSON or Arrow, see ``utils.api``.
+
+None of them is authenticated: the server listens on the loopback interface
+only, unless ``EMVIEW_STATUS_HOST`` is set to another address (``0.0.0.0``).
+"""
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils import api
+from utils.metrics import render_prometheus
+from utils.warmup import get_warmup
+
+logger = logging.getLogger(__name__)
+
+STATUS_HOST = os.getenv("EMVIEW_STATUS_HOST", "127.0.0.1")
+STATUS_PORT = int(os.getenv("EMVIEW_STATUS_PORT", "8502"))
+
+
+def healthz(handler) -> tuple:
+    return 200, {'status': 'ok'}
+
+
+def ready(handler) -> tuple:
+    status = get_warmup().status()
+    return (200 if status['ready'] else 503), status
+
+
+def metrics(handler) -> tuple:
+    return 200, render_prometheus()
+
+
+# Path -> handler returning (HTTP status, body) or (HTTP status, body,
+# headers); the body is JSON-serializable, text, or bytes sent as they are
+ROUTES = {
+    '/healthz': healthz,
+    '/ready': ready,
+    '/metrics': metrics,
+    **api.ROUTES
+}
+
+# Content type of text bodies, as expected by Prometheus
+TEXT_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        route = ROUTES.get(self.path.split('?', 1)[0])
+        if route is None:
+            code, body, headers = 404, {'error': 'not found'}, {}
+        else:
+            code, body, *headers = route(self)
+            headers = headers[0] if headers else {}
+        if isinstance(body, bytes):
+            payload = body
+        elif isinstance(body, str):
+            payload = body.encode()
+            headers.setdefault('Content-Type', TEXT_CONTENT_TYPE)
+        else:
+            payload = json.dumps(body).encode()
+            headers.setdefault('Content-Type', 'application/json')
+        self.send_response(code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if code != 304:
+            self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if code != 304:
+            self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_server(host: str = STATUS_HOST, port: int = STATUS_PORT):
+    """Start the status server in a daemon thread, once per process.
+
+    Disabled when ``port`` is 0. Returns the server, or None if disabled or
+    the port is already taken (e.g. by another process).
+    """
+    global _server
+    with _server_lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), StatusHandler)
+        except OSError:
+            logger.warning("Status server could not bind %s:%d", host, port, exc_info=True)
+            return None
+        threading.Thread(
+            target=_server.serve_forever, name="emview-status", daemon=True
+        ).start()
+        return _server
@@ -0,0 +1,378 @@
+"""Optional cache tier shared by the replicas of the dashboard.
+
+Without it, every replica loads ``emdata_hist`` and computes every
+aggregate on its own. With ``EMVIEW_SHARED_CACHE`` set, one replica loads
+the dataset and publishes it, and the others read it from the shared store.
+Computed aggregates are published the same way. Entries are keyed by
+dataset version, so one replica's computation serves all of them.
+
+``EMVIEW_SHARED_CACHE`` selects the store:
+
+- a directory, e.g. on a volume mounted by every replica: one file per
+  entry, read through a memory map,
+- ``redis://host:port/db``: a Redis-compatible server (needs the ``redis``
+  package),
+- ``memory``: an in-process stand-in for a Redis server, for development
+  and tests.
+
+Stores implement the subset of the Redis client API used here: ``get``,
+``set`` (with ``ex`` and ``nx``), ``exists`` and ``delete``, plus an atomic
+``delete_if`` (see :func:`delete_if`). Entries are pickles, so the store
+must only be writable by the replicas.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: FileStore locks only serialize the threads of one process
+    fcntl = None
+
+import streamlit as st
+
+from utils.snapshot import dump_snapshot, load_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Shared store: a directory, a redis:// URL or "memory"; disabled if empty
+SHARED_CACHE = os.getenv("EMVIEW_SHARED_CACHE", "")
+
+# Seconds shared entries are kept; keys include the dataset version, so this
+# only bounds the space taken by previous versions
+SHARED_CACHE_TTL = int(os.getenv("EMVIEW_SHARED_CACHE_TTL", "86400"))
+
+# Result cache kinds published to the shared store: the per-view stages and
+# the API responses. Filtered frames and sort orders are cheap to rebuild
+# from the dataset's indexes and large to move around.
+SHARED_KINDS = {'metric', 'map', 'time', 'api'}
+
+# Key prefix of every entry
+PREFIX = 'emview:'
+
+# Deletes KEYS[1] if it holds ARGV[1], in one step on the Redis server
+DELETE_IF_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class MemoryStore:
+    """In-process stand-in for a Redis server."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] < time.time():
+            del self._entries[key]
+            return None
+        return entry
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._live(key)
+            return None if entry is None else entry[0]
+
+    def set(self, key: str, value, ex: int = None, nx: bool = False) -> bool:
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return False
+            self._entries[key] = (bytes(value), None if ex is None else time.time() + ex)
+            return True
+
+    def exists(self, key: str) -> int:
+        with self._lock:
+            return int(self._live(key) is not None)
+
+    def delete(self, key: str) -> int:
+        with self._lock:
+            return int(self._entries.pop(key, None) is not None)
+
+    def delete_if(self, key: str, value) -> int:
+        with self._lock:
+            entry = self._live(key)
+            if entry is None or entry[0] != bytes(value):
+                return 0
+            del self._entries[key]
+            return 1
+
+
+class FileStore:
+    """Entries as files of a directory shared by the replicas.
+
+    A file's modification time is set to its expiry. Values are written
+    aside with it and renamed (or, with ``nx``, linked) into place, so
+    readers never see a partial entry, and returned as read-only memory
+    maps. Setting with ``nx`` and :meth:`delete_if` hold an exclusive lock
+    on the directory's :attr:`LOCK_FILE`, which makes them atomic with
+    respect to each other.
+    """
+
+    # Expiry of entries set without one
+    NEVER = 2 ** 31 - 1
+
+    # Seconds between two sweeps of expired files
+    SWEEP_INTERVAL = 300
+
+    # Lock file of the directory, never swept
+    LOCK_FILE = '.lock'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._last_sweep = 0.0
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the directory lock, shared by every replica using it."""
+        with self._thread_lock, open(os.path.join(self.directory, self.LOCK_FILE), 'ab') as file:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_EX)
+            yield
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    @staticmethod
+    def _expired(path: str) -> bool:
+        return os.stat(path).st_mtime < time.time()
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            if self._expired(path):
+                return None
+            with open(path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    return b''
+                return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _write_aside(path: str, value, expires: float) -> str:
+        """Write an entry next to ``path``, with its expiry, and return its path."""
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(value)
+        os.utime(tmp_path, (expires, expires))
+        return tmp_path
+
+    def set(self, key: str, value, ex: int = None, nx: bool = False) -> bool:
+        path = self._path(key)
+        expires = self.NEVER if ex is None else time.time() + ex
+        tmp_path = self._write_aside(path, value, expires)
+        if nx:
+            try:
+                with self._exclusive():
+                    try:
+                        if self._expired(path):
+                            os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    # Linking fails if the entry exists, and never exposes it
+                    # without its expiry
+                    os.link(tmp_path, path)
+                return True
+            except FileExistsError:
+                return False
+            finally:
+                os.remove(tmp_path)
+
+        os.replace(tmp_path, path)
+        self._sweep()
+        return True
+
+    def exists(self, key: str) -> int:
+        try:
+            return int(not self._expired(self._path(key)))
+        except FileNotFoundError:
+            return 0
+
+    def delete(self, key: str) -> int:
+        try:
+            os.remove(self._path(key))
+            return 1
+        except FileNotFoundError:
+            return 0
+
+    def delete_if(self, key: str, value) -> int:
+        path = self._path(key)
+        with self._exclusive():
+            try:
+                if self._expired(path):
+                    return 0
+                with open(path, 'rb') as file:
+                    if file.read() != bytes(value):
+                        return 0
+                os.remove(path)
+                return 1
+            except FileNotFoundError:
+                return 0
+
+    def _sweep(self) -> None:
+        """Remove expired entries, at most every :attr:`SWEEP_INTERVAL`."""
+        now = time.time()
+        if now - self._last_sweep < self.SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for entry in os.scandir(self.directory):
+            if entry.name == self.LOCK_FILE:
+                continue
+            try:
+                # Leftovers of interrupted writes expire as well
+                if entry.stat().st_mtime < now:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def delete_if(store, key: str, value: bytes) -> int:
+    """Delete ``key`` from ``store`` if it holds ``value``, atomically.
+
+    Redis clients run :data:`DELETE_IF_SCRIPT`; the other stores implement
+    ``delete_if`` themselves.
+    """
+    if hasattr(store, 'delete_if'):
+        return store.delete_if(key, value)
+    return store.eval(DELETE_IF_SCRIPT, 1, key, value)
+
+
+def open_store(location: str):
+    """Return the store configured by ``location``, see the module docstring."""
+    if location == 'memory':
+        return MemoryStore()
+    if location.startswith(('redis://', 'rediss://', 'unix://')):
+        import redis
+        return redis.Redis.from_url(location)
+    return FileStore(location)
+
+
+class SharedCache:
+    """Typed access to a shared store.
+
+    Store failures are logged and handled as misses: replicas then work on
+    their own, as without a shared tier.
+    """
+
+    def __init__(self, store, ttl: int = SHARED_CACHE_TTL):
+        self.store = store
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Counters are updated by every session thread
+        self._stats_lock = threading.Lock()
+        # Value of the dataset lock while this replica holds it
+        self._lock_token = None
+
+    @staticmethod
+    def result_key(key: tuple) -> str:
+        return PREFIX + 'result:' + hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def load(self, key: tuple):
+        """Return the result another replica published under ``key``, or None."""
+        try:
+            payload = self.store.get(self.result_key(key))
+            value = None if payload is None else pickle.loads(payload)
+        except Exception:
+            logger.warning("Could not read from the shared cache", exc_info=True)
+            value = None
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def save(self, key: tuple, value) -> None:
+        """Publish a computed result under ``key``."""
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            self.store.set(self.result_key(key), payload, ex=self.ttl)
+        except Exception:
+            logger.warning("Could not write to the shared cache", exc_info=True)
+
+    def current_version(self) -> str | None:
+        """Return the version of the dataset last published, if still fresh."""
+        try:
+            version = self.store.get(PREFIX + 'dataset')
+        except Exception:
+            logger.warning("Could not read from the shared cache", exc_info=True)
+            return None
+        return None if version is None else bytes(version).decode()
+
+    def fetch_dataset(self, version: str) -> tuple | None:
+        """Return the frame and column list of a published dataset version."""
+        try:
+            payload = self.store.get(PREFIX + 'dataset:' + version)
+            return None if payload is None else load_snapshot(payload)
+        except Exception:
+            logger.warning("Could not read the shared dataset %s", version, exc_info=True)
+            return None
+
+    def publish_dataset(self, dataset, fresh_for: int) -> None:
+        """Publish ``dataset`` as the current one for ``fresh_for`` seconds."""
+        key = PREFIX + 'dataset:' + dataset.version
+        try:
+            if not self.store.exists(key):
+                self.store.set(key, dump_snapshot(dataset.data, dataset.columns), ex=self.ttl)
+            self.store.set(PREFIX + 'dataset', dataset.version.encode(), ex=max(fresh_for, 1))
+        except Exception:
+            logger.warning("Could not publish the dataset to the shared cache", exc_info=True)
+
+    def lock_dataset(self, timeout: int) -> bool:
+        """Take the right to load the dataset, for at most ``timeout`` seconds.
+
+        True as well if the store cannot be reached, so that a replica never
+        waits on a store it cannot use.
+        """
+        token = uuid.uuid4().hex.encode()
+        try:
+            locked = bool(self.store.set(PREFIX + 'dataset:lock', token, ex=timeout, nx=True))
+        except Exception:
+            logger.warning("Could not lock the shared dataset", exc_info=True)
+            return True
+        if locked:
+            self._lock_token = token
+        return locked
+
+    def unlock_dataset(self) -> None:
+        """Release the dataset lock, unless it expired and another replica took it."""
+        token, self._lock_token = self._lock_token, None
+        if token is None:
+            return
+        try:
+            delete_if(self.store, PREFIX + 'dataset:lock', token)
+        except Exception:
+            logger.warning("Could not unlock the shared dataset", exc_info=True)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {'shared_hits': self.hits, 'shared_misses': self.misses}
+
+
+@st.cache_resource(show_spinner=False)
+def get_shared_cache() -> SharedCache | None:
+    """Return the shared cache tier, or None if disabled or unavailable."""
+    if not SHARED_CACHE:
+        return None
+    try:
+        return SharedCache(open_store(SHARED_CACHE))
+    except Exception:
+        logger.warning(
+            "Shared cache %s unavailable, caching locally only", SHARED_CACHE, exc_info=True
+        )
+        return None
@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+# Arrow IPC copy of emdata_hist, written after each successful database load
+SNAPSHOT_PATH = os.getenv("EMVIEW_SNAPSHOT_PATH", "data/emdata_hist.arrow")
+
+# Schema metadata entry listing every column of the table, loaded or not
+COLUMNS_METADATA = b"emview.columns"
+
+
+def snapshot_exists(path: str = SNAPSHOT_PATH) -> bool:
+    return bool(path) and os.path.isfile(path)
+
+
+def snapshot_table(data: pd.DataFrame, columns: list = None) -> pa.Table:
+    """Return ``data`` as an Arrow table, with ``columns`` in its metadata."""
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    if columns is not None:
+        table = table.replace_schema_metadata({
+            **table.schema.metadata,
+            COLUMNS_METADATA: json.dumps(list(columns)).encode()
+        })
+    return table
+
+
+def snapshot_frame(table: pa.Table) -> tuple[pd.DataFrame, list]:
+    """Return the frame and full column list of a snapshot table."""
+    metadata = table.schema.metadata or {}
+    data = table.to_pandas()
+    if COLUMNS_METADATA in metadata:
+        columns = json.loads(metadata[COLUMNS_METADATA])
+    else:
+        columns = list(data.columns)
+    return data, columns
+
+
+def write_snapshot(
+        data: pd.DataFrame,
+        path: str = SNAPSHOT_PATH,
+        columns: list = None) -> bool:
+    """
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The loaded EM-DAT frame. Its dtypes (categoricals, nullable
+        integers) are kept in the file's pandas metadata.
+    path : str, optional
+        Destination file. Writing is skipped if empty.
+    columns : list, optional
+        Every column of the table, when ``data`` holds only some of them.
+
+    Returns
+    -------
+    bool
+        True if the snapshot was written. The file is replaced atomically,
+        so a concurrent reader never sees a partial snapshot. Failures are
+        logged, not raised: the snapshot is only a fallback.
+    """
+    if not path:
+        return False
+    tmp_path = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        table = snapshot_table(data, columns)
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        return True
+    except (OSError, pa.ArrowException):
+        logger.warning("Could not write the dataset snapshot to %s", path, exc_info=True)
+        return False
+
+
+def read_snapshot(path: str = SNAPSHOT_PATH) -> tuple[pd.DataFrame, list]:
+    """Read the snapshot through a memory map, restoring the frame's dtypes.
+
+    Returns the frame and the table's full column list, which defaults to
+    the frame's columns for snapshots written without one.
+    """
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return snapshot_frame(table)
+
+
+def dump_snapshot(data: pd.DataFrame, columns: list = None) -> bytes:
+    """Return the snapshot of ``data`` as Arrow IPC file bytes."""
+    table = snapshot_table(data, columns)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def load_snapshot(buffer) -> tuple[pd.DataFrame, list]:
+    """Read a snapshot from bytes or a memory-mapped buffer, without copying."""
+    table = pa.ipc.open_file(pa.py_buffer(buffer)).read_all()
+    return snapshot_frame(table)
@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+
+import streamlit as st
+
+from utils.aggregates import (
+    gather_stages, get_map_aggregates, get_metric_table, get_time_series
+)
+from utils.database import AGGREGATES
+from utils.dataset import Dataset, get_dataset, load_dataset
+from utils.filters import (
+    default_filters, get_filter_options, get_filter_state, get_filtered_cube,
+    get_filtered_data, uses_database_aggregates
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Load the shared dataset and its derived structures in the background.
+
+    Started once per process, at server start by ``serve.py`` or at the
+    first script run otherwise. ``done`` is set when the attempt finishes,
+    successfully or not; ``ready`` tells which.
+
+    With ``EMVIEW_AGGREGATES=database`` the chart pages read Postgres views,
+    so only those are primed: the dataset is loaded on demand, by the pages
+    and filters that need it (see :func:`wait_for_dataset`).
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ready = False
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the warm-up unless it is running or has succeeded."""
+        with self._lock:
+            if self.ready or (self._thread is not None and self._thread.is_alive()):
+                return
+            self.done.clear()
+            self.error = None
+            self.started_at = time.time()
+            self._thread = threading.Thread(
+                target=self._run, name="emview-warmup", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            # Prime the shared caches with what the default sidebar shows
+            if AGGREGATES == 'database':
+                options = get_filter_options()
+                if options is None:
+                    raise RuntimeError("The database aggregates are unavailable")
+                filters = options[1]
+            else:
+                filters = default_filters(load_dataset())
+                get_filtered_data(filters)
+                get_filtered_cube(filters)
+            gather_stages(filters, get_metric_table, get_map_aggregates, get_time_series)
+            self.ready = True
+            logger.info("Warm-up done in %.1f s", time.time() - self.started_at)
+        except Exception as exc:
+            self.error = exc
+            logger.warning("Warm-up failed", exc_info=True)
+        finally:
+            self.finished_at = time.time()
+            self.done.set()
+
+    def status(self) -> dict:
+        return {
+            'ready': self.ready,
+            'running': not self.done.is_set() and self.started_at is not None,
+            'error': None if self.error is None else repr(self.error),
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+@st.cache_resource
+def get_warmup() -> Warmup:
+    """Return the process-wide warm-up."""
+    return Warmup()
+
+
+def start_warmup() -> Warmup:
+    warmup = get_warmup()
+    warmup.start()
+    return warmup
+
+
+def wait_for_dataset() -> Dataset | None:
+    """Return the shared dataset, waiting for the warm-up with a spinner.
+
+    Returns None if loading failed, so that pages can show their error.
+    """
+    dataset = get_dataset()
+    if dataset is not None:
+        return dataset
+
+    warmup = start_warmup()
+    with st.spinner("Loading the EM-DAT dataset..."):
+        warmup.done.wait()
+        if get_dataset() is None and AGGREGATES == 'database':
+            # Not loaded by the warm-up
+            try:
+                return load_dataset()
+            except Exception:
+                logger.warning("Loading the EM-DAT dataset failed", exc_info=True)
+    return get_dataset()
+
+
+def wait_for_aggregates() -> bool:
+    """Tell whether the chart pages have data, waiting for it if needed.
+
+    The database aggregates answer right away, unless the filters need the
+    dataset (see ``utils.filters.uses_database_aggregates``).
+    """
+    if (AGGREGATES == 'database' and get_filter_options() is not None
+            and uses_database_aggregates(get_filter_state())):
+        return True
+    return wait_for_dataset() is not None
@@ -3,40 +3,60 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import streamlit as st
-from utils.database import get_full_data
+from sqlalchemy.exc import SQLAlchemyError
+
+from utils.cache import get_result_cache
+from utils.database import AGGREGATES, get_filter_summary
+from utils.dataset import get_dataset, get_store
 from utils.layout import PAGE_HELP_TEXT
+from utils.warmup import wait_for_dataset
 
 # Set page
 st.session_state['page'] = 'home'
 
-# Load data only once into session state
-if 'data' not in st.session_state:
-    st.info("Connecting to the EM-DAT database...")
-    data = get_full_data()
-    st.session_state['data'] = data
-    st.success("Data loaded successfully from database.")
-
-    # Prepare region, subregion, country filters (correct Postgres fields)
-    region_data = data[['region', 'subregion', 'country']].drop_duplicates()
-    st.session_state['region_list'] = [None] + sorted(region_data['region'].dropna().unique())
-    st.session_state['subregion_list'] = [None] + sorted(region_data['subregion'].dropna().unique())
-    st.session_state['country_list'] = [None] + sorted(region_data['country'].dropna().unique())
-    st.session_state['region_data'] = region_data
-
 # Display page content
 st.header('EM-VIEW Disaster Dashboard')
 st.write(PAGE_HELP_TEXT[st.session_state['page']])
 
-# Display database metadata
-if "data" in st.session_state:
-    data = st.session_state['data']
-    
+# Display database metadata. Data is loaded once per process, in the
+# background from server start; every session shares the same dataset.
+# With the database aggregates it is only loaded on demand, and the
+# metadata is summarized by Postgres until then.
+dataset = get_dataset()
+summary = None
+if dataset is None and AGGREGATES == 'database':
+    try:
+        summary = get_filter_summary()
+    except SQLAlchemyError:
+        pass
+if dataset is None and summary is None:
+    dataset = wait_for_dataset()
+
+if dataset is None and summary is None:
+    st.error('No disaster data available. Please check database connection.', icon="🚨")
+else:
     st.subheader("Database Information")
 
     # Fix date fields for Postgres columns
-    st.write(f"**Date range:** {int(data['start_year'].min())} - {int(data['end_year'].max())}")
-    st.write(f"**Number of disaster records:** {len(data)}")
+    if dataset is not None:
+        data = dataset.data
+        first_year, last_year = int(data['start_year'].min()), int(data['end_year'].max())
+        records = len(data)
+    else:
+        first_year, last_year = int(summary['first_year'].min()), int(summary['last_end_year'].max())
+        records = int(summary['rows'].sum())
+    st.write(f"**Date range:** {first_year} - {last_year}")
+    st.write(f"**Number of disaster records:** {records}")
+
+    # Data is refreshed incrementally; a full reload is only done on request
+    if st.button("Reload from database", help="Discard the loaded data and reload the full table."):
+        get_store().reload()
+        st.rerun()
+
+    with st.expander("Cache statistics", expanded=False):
+        st.json(get_result_cache().stats())
 
     # Show dataset preview
-    with st.expander("Preview Dataset", expanded=False):
-        st.dataframe(data.head(20), use_container_width=True)
\ No newline at end of file
+    if dataset is not None:
+        with st.expander("Preview Dataset", expanded=False):
+            st.dataframe(dataset.data.head(20), use_container_width=True)
\ No newline at end of file
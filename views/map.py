@@ -1,8 +1,13 @@
 import plotly.graph_objects as go
 import streamlit as st
 
-from utils.filters import get_filtered_data
+from utils.aggregates import (
+    MAP_AGGREGATORS, gather_stages, get_map_aggregates, get_year_range
+)
+from utils.filters import get_filter_state
 from utils.layout import generate_colorscale, PAGE_HELP_TEXT
+from utils.metrics import plotly_chart
+from utils.warmup import wait_for_aggregates
 
 SCOPES = ['world', 'africa', 'asia', 'europe', 'north america', 'south america']
 COLORMAPS = [
@@ -38,14 +43,14 @@ TITLE_DICT = {
 st.session_state["page"] = "map"
 
 # Check if data is loaded
-if "data" not in st.session_state:
+if not wait_for_aggregates():
     st.error('No disaster data available. Please check database connection.', icon="🚨")
 else:
-    data = get_filtered_data()
-
-    # Data & period
-    year_min = int(data['start_year'].min())
-    year_max = int(data['end_year'].max())
+    # Data & period, with every aggregator and variable precomputed for the
+    # filters: with the database aggregates, both are queried concurrently
+    (year_min, year_max), map_aggregates = gather_stages(
+        get_filter_state(), get_year_range, get_map_aggregates
+    )
     period = f"{year_min}-{year_max}" if year_min < year_max else f"{year_min}"
 
     if st.session_state.get('filter.country') is not None:
@@ -66,7 +71,7 @@ else:
         )
         aggregator = row0_cols[2].selectbox(
             'Aggregate by',
-            ['Total', 'Yearly Average', 'Yearly Median']
+            MAP_AGGREGATORS.keys()
         )
         custom = row1_cols[3].toggle('Custom Color Scale', value=False)
         land_color = row1_cols[0].color_picker('No Data', value='#dddddd')
@@ -83,37 +88,9 @@ else:
             bottom_color = row1_cols[2].color_picker('Bottom Color', '#ffffff')
             cmap = generate_colorscale(bottom_color, top_color)
 
-        # Aggregate annually
-        annual_data = data.groupby(
-            ['country', 'region', 'iso', 'start_year']
-        ).agg(
-            count=('iso', 'count'),
-            death=('total_deaths', 'sum'),
-            affected=('total_affected', 'sum'),
-            damage=('total_damage_adjusted_usd_thousands', 'sum')
-        ).reset_index()
-
-        if aggregator == 'Total':
-            data_map = annual_data.groupby(['country', 'region', 'iso']).agg(
-                count=('count', 'sum'),
-                death=('death', 'sum'),
-                affected=('affected', 'sum'),
-                damage=('damage', 'sum')
-            ).reset_index()
-        elif aggregator == 'Yearly Average':
-            data_map = annual_data.groupby(['country', 'region', 'iso']).agg(
-                count=('count', 'mean'),
-                death=('death', 'mean'),
-                affected=('affected', 'mean'),
-                damage=('damage', 'mean')
-            ).reset_index()
-        elif aggregator == 'Yearly Median':
-            data_map = annual_data.groupby(['country', 'region', 'iso']).agg(
-                count=('count', 'median'),
-                death=('death', 'median'),
-                affected=('affected', 'median'),
-                damage=('damage', 'median')
-            ).reset_index()
+        data_map = map_aggregates[aggregator]
+        unmappable = data_map[~data_map['mappable']]
+        data_map = data_map[data_map['mappable']]
 
         # Map Plot
         fig = go.Figure(
@@ -153,7 +130,18 @@ else:
             )
         )
 
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(fig, use_container_width=True)
+
+        if not unmappable.empty:
+            st.caption(
+                "_Not shown on the map (former countries or territories "
+                "without a shape): "
+                + ", ".join(
+                    f"{row.country} ({row.iso}): {row[variable]:,.0f}"
+                    for _, row in unmappable.sort_values('country').iterrows()
+                )
+                + "._"
+            )
 
         # Page Help
         with st.expander("See page details", expanded=False, icon=':material/info:'):
@@ -1,7 +1,18 @@
+import math
+
+import pyarrow as pa
 import streamlit as st
+from sqlalchemy.exc import SQLAlchemyError
 
-from utils.filters import get_filtered_data
+from utils.dataset import get_dataset
+from utils.filters import (
+    get_columns, get_filter_options, get_filter_state, get_filtered_data,
+    plan_filtered_query
+)
 from utils.layout import PAGE_HELP_TEXT
+from utils.metrics import dataframe
+from utils.paging import get_page, get_query_page, query_rows
+from utils.warmup import wait_for_dataset
 
 # Default columns for table view - use Postgres field names
 DEFAULT_COLUMNS = [
@@ -13,37 +24,103 @@ DEFAULT_COLUMNS = [
     "total_damage_adjusted_usd_thousands"
 ]
 
-# Format numbers for start and end years
-DEFAULT_STYLE = {
-    "start_year": '{:.0f}',
-    "end_year": '{:.0f}'
-}
+# Number formats, applied in the browser: years as is, other numbers with
+# thousands separators
+YEAR_COLUMNS = ["start_year", "end_year"]
+NUMBER_FORMAT = "localized"
+
+PAGE_SIZES = [15, 50, 100, 500]
+
+# Rows visible at once; larger pages scroll inside the table
+DISPLAY_ROWS = 15
 
 # Set page
 st.session_state["page"] = "table"
 
+# While the dataset loads, narrow filters are answered by Postgres and wider
+# ones wait for it (see utils.filters.plan_filtered_query)
+pushdown = (
+    get_dataset() is None
+    and get_filter_options() is not None
+    and plan_filtered_query(get_filter_state()) == 'database'
+)
+
 # Check if data is loaded
-if "data" not in st.session_state:
+dataset = None if pushdown else wait_for_dataset()
+if dataset is None and not pushdown:
     st.error('No disaster data available. Please check database connection.', icon="🚨")
 else:
-    data = get_filtered_data()
+    filters = get_filter_state()
+    table_columns = get_columns(dataset)
 
     columns = st.multiselect(
         "Select columns:",
-        data.columns,
-        default=DEFAULT_COLUMNS
+        table_columns,
+        default=[c for c in DEFAULT_COLUMNS if c in table_columns]
+    )
+
+    col1, col2, col3, col4 = st.columns([3, 2, 2, 2])
+    sort = col1.selectbox(
+        "Sort by",
+        [None] + table_columns,
+        format_func=lambda x: 'Default order' if x is None else x
+    )
+    ascending = col2.selectbox(
+        "Order",
+        [True, False],
+        format_func=lambda x: 'Ascending' if x else 'Descending',
+        disabled=sort is None
+    )
+    page_size = col3.selectbox("Rows per page", PAGE_SIZES)
+    if pushdown:
+        total_rows = len(query_rows(filters, columns, sort))
+    else:
+        total_rows = len(get_filtered_data(filters))
+    page_count = max(1, math.ceil(total_rows / page_size))
+    page = col4.number_input(
+        f"Page (of {page_count:,})",
+        min_value=1,
+        max_value=page_count,
+        value=1
     )
 
-    display_rows = 15
+    # Only the visible page is sorted into, fetched and sent to the browser.
+    # Columns outside the core set are fetched from the database on demand.
+    if pushdown:
+        table = get_query_page(filters, columns, sort, ascending, page - 1, page_size)
+    else:
+        try:
+            table = get_page(filters, columns, sort, ascending, page - 1, page_size)
+        except SQLAlchemyError:
+            st.warning(
+                'Some columns could not be loaded from the database.', icon="⚠️"
+            )
+            loaded = [c for c in columns if c in dataset.data.columns]
+            table = get_page(
+                filters, loaded, sort if sort in loaded else None,
+                ascending, page - 1, page_size
+            )
 
-    st.dataframe(
-        data[columns].style.format(
-            DEFAULT_STYLE,
-            precision=0,
-            thousands=','
-        ),
-        height=(display_rows + 1) * 35 + 3,
-        use_container_width=True
+    column_config = {
+        field.name: st.column_config.NumberColumn(
+            format="%d" if field.name in YEAR_COLUMNS else NUMBER_FORMAT
+        )
+        for field in table.schema
+        if pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+    }
+
+    first_row = (page - 1) * page_size
+    dataframe(
+        table,
+        column_config=column_config,
+        height=(DISPLAY_ROWS + 1) * 35 + 3,
+        use_container_width=True,
+        hide_index=True
+    )
+    st.caption(
+        f"Rows {min(first_row + 1, total_rows):,}–"
+        f"{min(first_row + page_size, total_rows):,} of {total_rows:,}"
+        + (" (queried from the database while the dataset loads)" if pushdown else "")
     )
 
     # Page Help
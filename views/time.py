@@ -1,9 +1,11 @@
 import plotly.express as px
 import streamlit as st
 
+from utils.aggregates import TIME_STACKINGS, get_time_series
 from utils.distypes import TYPE_ORDER, TYPE_COLORS
-from utils.filters import get_filtered_data
 from utils.layout import PAGE_HELP_TEXT
+from utils.metrics import plotly_chart
+from utils.warmup import wait_for_aggregates
 
 VAR_DICT = {
     'count': 'N° Count',
@@ -16,10 +18,10 @@ VAR_DICT = {
 st.session_state["page"] = "time"
 
 # Check if data is loaded
-if "data" not in st.session_state:
+if not wait_for_aggregates():
     st.error('No disaster data available. Please check database connection.', icon="🚨")
 else:
-    data = get_filtered_data()
+    series = get_time_series()
 
     cols = st.columns(2)
     variable = cols[0].selectbox(
@@ -29,28 +31,15 @@ else:
     )
     stacker = cols[1].selectbox(
         "Stack by",
-        [None, 'Types', 'Regions', 'Subregions']
+        TIME_STACKINGS.keys()
     )
+    data_time = series[stacker]
 
     if stacker is None:
-        data_time = data.groupby(['start_year']).agg(
-            count=('disno', 'count'),
-            death=('total_deaths', 'sum'),
-            affected=('total_affected', 'sum'),
-            damage=('total_damage_adjusted_usd_thousands', 'sum')
-        ).reset_index()
-
         fig = px.bar(data_time, x='start_year', y=variable)
         fig.update_traces(marker_color='#214B8C')
 
     elif stacker == 'Types':
-        data_time = data.groupby(['start_year', 'disaster_type']).agg(
-            count=('disno', 'count'),
-            death=('total_deaths', 'sum'),
-            affected=('total_affected', 'sum'),
-            damage=('total_damage_adjusted_usd_thousands', 'sum')
-        ).reset_index()
-
         order = [i for i in TYPE_ORDER if i in data_time['disaster_type'].unique()]
         fig = px.bar(
             data_time,
@@ -61,34 +50,12 @@ else:
         )
         fig.for_each_trace(lambda t: t.update(marker_color=TYPE_COLORS.get(t.name, '#214B8C')))
 
-    elif stacker == 'Regions':
-        data_time = data.groupby(['start_year', 'region']).agg(
-            count=('disno', 'count'),
-            death=('total_deaths', 'sum'),
-            affected=('total_affected', 'sum'),
-            damage=('total_damage_adjusted_usd_thousands', 'sum')
-        ).reset_index()
-
-        fig = px.bar(
-            data_time,
-            x='start_year',
-            y=variable,
-            color='region'
-        )
-
-    elif stacker == 'Subregions':
-        data_time = data.groupby(['start_year', 'subregion']).agg(
-            count=('disno', 'count'),
-            death=('total_deaths', 'sum'),
-            affected=('total_affected', 'sum'),
-            damage=('total_damage_adjusted_usd_thousands', 'sum')
-        ).reset_index()
-
+    else:
         fig = px.bar(
             data_time,
             x='start_year',
             y=variable,
-            color='subregion'
+            color=TIME_STACKINGS[stacker]
         )
 
     # Final figure layout
@@ -96,7 +63,7 @@ else:
         yaxis_title=VAR_DICT[variable]
     )
 
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(fig, use_container_width=True)
 
     # Page Help
     with st.expander("See page details", expanded=False, icon=':material/info:'):